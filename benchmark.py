@@ -0,0 +1,120 @@
+import os
+import json
+import time
+import shutil
+import platform
+import importlib.util
+import numpy as np
+from SALib.analyze import sobol
+
+from src.column_settings import settings_dict
+from src.data_loader import build_cache, load_dataset, required_columns, data_fingerprint
+from src.feature_gen import optimize_preprocessing
+from src.splits import prepare_splits
+from src.sobol import get_saltelli_sample, analyze_batched, remove_groups_from_problem
+from src.problem_definitions import problem_minimum
+from src.results_store import ResultsStore
+from src.synthetic import write_synthetic_dataset, LABELS
+from src.profiling import Tracer, PROFILE, package_versions
+
+# Benchmarks run on synthetic data with the NEBULA schema, so they need neither the real file nor a long fit
+BENCH_DIR = os.environ.get('BENCH_DIR', './results/benchmarks')
+bench_rows = [int(n) for n in os.environ.get('BENCH_ROWS', '10000,100000').split(',')]
+col_setting = int(os.environ.get('COL_SETTING', 52))
+time_lim = int(os.environ.get('TIME_LIM', 60))
+sobol_N = int(os.environ.get('N', 4096))
+# Fit and prediction need AutoGluon; without it those stages are skipped
+has_autogluon = importlib.util.find_spec('autogluon') is not None
+
+
+def _stage_result(record, n_items):
+    return {'seconds': record['seconds'], 'items_per_sec': n_items / record['seconds'] if record['seconds'] else None,
+            'n_items': n_items, 'peak_rss_mb': record['peak_rss_mb']}
+
+
+def bench_dataset(n_rows):
+    """
+    Time each pipeline stage on a synthetic dataset of n_rows postcodes.
+    Caches, splits and runs are rebuilt from scratch so timings are comparable between runs.
+    """
+    work_dir = os.path.join(BENCH_DIR, f'rows_{n_rows}')
+    data_path = os.path.join(BENCH_DIR, 'data', f'synthetic_nebula_{n_rows}.csv')
+    cache_dir = os.path.join(work_dir, 'cache')
+    if os.path.exists(work_dir):
+        shutil.rmtree(work_dir)
+
+    tracer = Tracer(f'benchmark_{n_rows}', mode=PROFILE if PROFILE != 'off' else 'on')
+    stages = {}
+    skipped = []
+    label = LABELS[0]
+
+    def timed(name, n_items, fn):
+        with tracer.span(name) as record:
+            result = fn()
+        stages[name] = _stage_result(record, n_items)
+        print(f"{n_rows} rows, {name}: {record['seconds']:.2f} seconds")
+        return result
+
+    timed('generate', n_rows, lambda: write_synthetic_dataset(data_path, n_rows))
+    timed('cache_build', n_rows, lambda: build_cache(data_path, cache_dir))
+    columns = required_columns(label, col_setting, settings_dict)
+    df = timed('load', n_rows, lambda: load_dataset(data_path, columns=columns, keep_dtypes=[label], cache_dir=cache_dir))
+    df_all = timed('load_all_columns', n_rows, lambda: load_dataset(data_path, cache_dir=cache_dir))
+    timed('optimize_preprocessing', n_rows, lambda: optimize_preprocessing(df_all))
+    del df_all
+    fingerprint = data_fingerprint(data_path, cache_dir)
+    timed('split', n_rows, lambda: prepare_splits(df, fingerprint, cache_dir))
+
+    problem = remove_groups_from_problem(problem_minimum)
+    X = timed('sobol_sample', sobol_N, lambda: get_saltelli_sample(problem, sobol_N,
+                                                                    cache_dir=os.path.join(work_dir, 'sobol_samples')))
+    # A smooth stand-in for the model, so the analysis is timed on realistic output sizes
+    Y = np.sin(np.asarray(X, dtype=np.float64) / np.ptp(X, axis=0)).sum(axis=1)
+    timed('sobol_analyze', len(Y), lambda: analyze_batched(problem, Y, seed=42))
+    timed('sobol_analyze_salib', len(Y), lambda: sobol.analyze(problem, Y, seed=42))
+
+    if has_autogluon:
+        from run_automl import run_model, transform
+        from src.inference import predict_to_parquet
+
+        timed('transform', n_rows, lambda: transform(df, label, col_setting, settings_dict))
+        config = {'DATA_PATH': data_path, 'OUTPUT_PATH': os.path.join(work_dir, 'runs'), 'MODEL_PRESET': 'medium_quality',
+                  'TIME_LIM': str(time_lim), 'TRAIN_SUBSET_PROP': '1.0', 'MODEL_TYPES': 'all', 'TARGET': 'totalelec',
+                  'COL_SETTING': str(col_setting), 'RUN_REGIONAL': 'No', 'run_census': 'No', 'REGION_ID': None}
+        run_dir = timed('run_model', n_rows, lambda: run_model(config, df=df, cache_dir=cache_dir))
+        with open(os.path.join(run_dir, 'model_summary.json'), 'r') as f:
+            run_summary = json.load(f)
+        for stage, seconds in run_summary['timings'].items():
+            stages[f'run_model_{stage}'] = {'seconds': seconds}
+        cache_path = build_cache(data_path, cache_dir)
+        timed('batch_predict', n_rows, lambda: predict_to_parquet(run_dir, cache_path, os.path.join(work_dir, 'predictions.parquet'),
+                                                                  col_setting, id_columns=['postcode'], use_cache=False))
+        store = ResultsStore(os.path.join(work_dir, 'results_store.sqlite'))
+        timed('extraction', 1, lambda: store.ingest(config['OUTPUT_PATH']))
+    else:
+        skipped = ['transform', 'run_model', 'batch_predict', 'extraction']
+        print(f'AutoGluon is not installed, skipping {skipped}')
+
+    tracer.save(work_dir)
+    return {'n_rows': n_rows, 'stages': stages, 'skipped': skipped}
+
+
+def main():
+    start_time = time.time()
+    datasets = [bench_dataset(n_rows) for n_rows in bench_rows]
+    results = {
+        'started_at': start_time,
+        'config': {'col_setting': col_setting, 'time_limit': time_lim, 'sobol_N': sobol_N, 'rows': bench_rows},
+        'host': {'platform': platform.platform(), 'cpu_count': os.cpu_count()},
+        'versions': package_versions(),
+        'datasets': datasets,
+    }
+    results['total_seconds'] = time.time() - start_time
+    output_file = os.path.join(BENCH_DIR, f'benchmark_{time.strftime("%Y%m%d_%H%M%S", time.localtime(start_time))}.json')
+    with open(output_file, 'w') as f:
+        json.dump(results, f, indent=4)
+    print(f'Benchmark results saved to {output_file}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,24 @@
+import os
+
+from src.feature_pipeline import write_features, FLOOR_AREA_COLUMNS
+
+
+def main():
+    input_path = os.environ.get('INPUT_PATH')
+    output_file = os.environ.get('OUTPUT_FILE')
+    chunksize = int(os.environ.get('CHUNK_SIZE', 100000))
+    n_workers = int(os.environ.get('N_WORKERS', 1))
+    # Two comma separated columns, or 'none' to skip the floor area confidence
+    floor_area_env = os.environ.get('FLOOR_AREA_COLS', ','.join(FLOOR_AREA_COLUMNS))
+    floor_area_columns = None if floor_area_env == 'none' else tuple(floor_area_env.split(','))
+
+    if input_path is None or output_file is None:
+        raise ValueError('INPUT_PATH and OUTPUT_FILE must be set')
+
+    print(f'Building features for {input_path} with {n_workers} workers')
+    write_features(input_path, output_file, chunksize=chunksize, n_workers=n_workers,
+                   floor_area_columns=floor_area_columns)
+
+
+if __name__ == '__main__':
+    main()
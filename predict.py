@@ -0,0 +1,33 @@
+import os
+
+from src.column_settings import settings_dict, settings_col_dict_census
+from src.inference import predict_to_parquet
+from src.distill import resolve_model_path
+
+
+def main():
+    model_path = os.environ.get('MODEL_PATH')
+    input_path = os.environ.get('INPUT_PATH')
+    output_file = os.environ.get('OUTPUT_FILE')
+    column_setting = int(os.environ.get('COL_SETTING'))
+    run_census = os.environ.get('run_census')
+    id_columns = [c for c in os.environ.get('ID_COLUMNS', 'postcode').split(',') if c]
+    chunksize = int(os.environ.get('CHUNK_SIZE', 100000))
+    n_workers = int(os.environ.get('N_WORKERS', 1))
+    model_variant = os.environ.get('MODEL_VARIANT', 'full')
+    use_cache = os.environ.get('PREDICTION_CACHE', 'on') == 'on'
+
+    if model_path is None or input_path is None or output_file is None:
+        raise ValueError('MODEL_PATH, INPUT_PATH and OUTPUT_FILE must be set')
+
+    # Score with a fast surrogate from run_distill.py instead of the full ensemble
+    model_path = resolve_model_path(model_path, model_variant)
+    setting_dir = settings_col_dict_census if run_census == 'Yes' else settings_dict
+
+    print(f'Scoring {input_path} with {model_path}, col setting {column_setting}, chunk size {chunksize} and {n_workers} workers')
+    predict_to_parquet(model_path, input_path, output_file, column_setting, setting_dir,
+                       id_columns=id_columns, chunksize=chunksize, n_workers=n_workers, use_cache=use_cache)
+
+
+if __name__ == '__main__':
+    main()
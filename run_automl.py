@@ -1,12 +1,19 @@
-import sys
 import os
+import json
+import resource
 import pandas as pd
 from datetime import datetime
-from sklearn.model_selection import train_test_split
 from autogluon.tabular import TabularDataset, TabularPredictor
 
 
 from src.column_settings import settings_dict, settings_col_dict_census
+from src.data_loader import CACHE_DIR, load_dataset, required_columns, data_fingerprint
+from src.manifest import RunManifest
+from src.splits import REGIONS, global_split, region_split, subset_split, prepare_splits
+from src.scheduler import run_jobs
+from src.profiling import Tracer
+from src.column_registry import get_registry
+from src.warm_start import warm_start_hyperparameters
 
 
 def check_directory_and_files(output_directory, required_files):
@@ -34,10 +41,13 @@ def check_directory_and_files(output_directory, required_files):
     return True
 
 
-def transform(df, label, col_setting, settting_dict ):
-    cols = settting_dict[col_setting][1]
-    working_cols = cols + [label]
-    df = df[working_cols]
+def transform(df, label, col_setting, settting_dict, rows=None):
+    # Rows and cached column positions are taken in one step, so only the run's cells are copied
+    column_set = get_registry(df).resolve(col_setting, settting_dict, label)
+    if rows is None:
+        df = column_set.project_frame(df)
+    else:
+        df = df.iloc[rows, column_set.positions]
     df = df[~df[label].isna()]
     return df
 
@@ -47,104 +57,319 @@ def save_results(results, output_path):
         f.write(res_string)
 
 
-def main():
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux; children covers AutoGluon's worker processes
+    return {'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            'peak_rss_children_mb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024}
 
-    data_path = os.environ.get('DATA_PATH')
-    output_path = os.environ.get('OUTPUT_PATH')
-    model_preset= os.environ.get('MODEL_PRESET')
-    time_limit = int(os.environ.get('TIME_LIM'))
-    train_subset_prop = float(os.environ.get('TRAIN_SUBSET_PROP') )
-    model_types = os.environ.get('MODEL_TYPES')
-    target = os.environ.get('TARGET')
-    column_setting =int( os.environ.get('COL_SETTING'))
-    run_regionally = os.environ.get('RUN_REGIONAL')
-    run_census = os.environ.get('run_census')   
-    region_id = os.environ.get('REGION_ID')
 
-    
+def save_summary(record, output_path):
+    """
+    Merge record into model_summary.json, the typed counterpart of model_summary.txt.
+    Stage timings are merged too, so a run that only reruns some stages keeps the others.
+    """
+    path = os.path.join(output_path, 'model_summary.json')
+    summary = {}
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            summary = json.load(f)
+    timings = {**summary.get('timings', {}), **record.get('timings', {})}
+    summary.update(record)
+    summary['timings'] = timings
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(summary, f, indent=4, default=str)
+    os.replace(tmp_path, path)
+
+
+# Global runs whose models warm start the leave-one-region-out folds
+WARM_START_PATH = os.environ.get('WARM_START_PATH', './results/model_results')
+
+CONFIG_KEYS = ['DATA_PATH', 'OUTPUT_PATH', 'MODEL_PRESET', 'TIME_LIM', 'TRAIN_SUBSET_PROP', 'MODEL_TYPES',
+               'TARGET', 'COL_SETTING', 'RUN_REGIONAL', 'run_census', 'REGION_ID']
+
+
+def config_from_env():
+    return {key: os.environ.get(key) for key in CONFIG_KEYS}
+
+
+def env_list(key):
+    value = os.environ.get(key)
+    return [item.strip() for item in value.split(',') if item.strip()] if value else None
+
+
+def sweep_configs(config, col_settings=None, targets=None):
+    """
+    One run configuration per target and column setting, with config supplying everything else.
+    """
+    col_settings = col_settings or [config['COL_SETTING']]
+    targets = targets or [config['TARGET']]
+    return [dict(config, COL_SETTING=str(col_setting), TARGET=target) for target in targets for col_setting in col_settings]
+
+
+def get_label(target):
     if target == 'totalelec':   
-        label = 'total_elec'
+        return 'total_elec'
     elif target == 'totalgas':
-        label = 'total_gas'
+        return 'total_gas'
     else:
         raise Exception('No target')
 
+
+def get_setting_dict(run_census):
+    if run_census =='Yes':
+        return settings_col_dict_census
+    return settings_dict
+
+
+def get_output_directory(config):
+    """
+    The run folder of a configuration, as run_model names it.
+    """
+    dataset_name = os.path.basename(config['DATA_PATH']).split('.')[0].split('_tr')[0]
+    regional = config['RUN_REGIONAL'] == 'Yes'
+    loc_type = 'local' if regional else 'global'
+    region_id = config['REGION_ID'] if regional else None
+    return (f"{config['OUTPUT_PATH']}/{dataset_name}__{loc_type}__{get_label(config['TARGET'])}__{int(config['TIME_LIM'])}"
+            f"__colset_{int(config['COL_SETTING'])}__{config['MODEL_PRESET']}___tsp_{float(config['TRAIN_SUBSET_PROP'])}"
+            f"__{config['MODEL_TYPES']}__{region_id}")
+
+
+def regional_cv_configs(config, warm_start_path=WARM_START_PATH):
+    """
+    Leave-one-region-out fold configurations of config, one per region.
+
+    When the matching global run (same target, column setting, preset and time limit) has been
+    trained under warm_start_path, every fold fits that run's first-level models with their
+    fitted hyperparameters instead of searching the preset's model zoo from scratch.
+    """
+    global_directory = get_output_directory(dict(config, OUTPUT_PATH=warm_start_path, RUN_REGIONAL='No', REGION_ID=None))
+    warm_start = {}
+    if os.path.isfile(os.path.join(global_directory, 'predictor.pkl')):
+        warm_start = {'WARM_START': global_directory}
+    else:
+        print(f'No global run at {global_directory}, regional folds start from scratch')
+    return [dict(config, RUN_REGIONAL='Yes', REGION_ID=region_id, **warm_start) for region_id in REGIONS]
+
+
+def run_columns(config):
+    """
+    Return the columns a run configuration reads and its label column.
+    """
+    label = get_label(config['TARGET'])
+    setting_dir = get_setting_dict(config['run_census'])
+    columns = required_columns(label, int(config['COL_SETTING']), setting_dir, config['RUN_REGIONAL'] == 'Yes')
+    return columns, label
+
+
+def run_model(config, df=None, num_cpus='auto', cache_dir=CACHE_DIR):
+    """
+    Train and evaluate the model for one run configuration.
     
-    excl_models = []
+    Parameters:
+        config (dict): Run settings, keyed as in CONFIG_KEYS.
+        df (pd.DataFrame): Preloaded data holding at least the run columns; loaded from DATA_PATH if None.
+        num_cpus (int or str): CPUs given to TabularPredictor.fit.
+        cache_dir (str): Directory of the Parquet cache, data fingerprints and split index files.
     
-    df = pd.read_csv(data_path)
-    dataset_name = os.path.basename(data_path).split('.')[0].split('_tr')[0]
+    Returns:
+        str: The output directory of the run.
+    """
+    data_path = config['DATA_PATH']
+    output_path = config['OUTPUT_PATH']
+    model_preset= config['MODEL_PRESET']
+    time_limit = int(config['TIME_LIM'])
+    train_subset_prop = float(config['TRAIN_SUBSET_PROP'] )
+    model_types = config['MODEL_TYPES']
+    target = config['TARGET']
+    column_setting =int( config['COL_SETTING'])
+    run_regionally = config['RUN_REGIONAL']
+    run_census = config['run_census']   
+    region_id = config['REGION_ID']
+    warm_start = config.get('WARM_START')
+
+    
+    label = get_label(target)
+
+    
+    excl_models = []
     
- 
     if run_census =='Yes':
         print('running with census data')
-        setting_dir = settings_col_dict_census
-    else: 
-        setting_dir = settings_dict 
+    setting_dir = get_setting_dict(run_census)
 
+    # Stage spans feed the timings in model_summary.json, and trace.json when PROFILE is set
+    tracer = Tracer('run_automl')
+    if df is None:
+        with tracer.span('load'):
+            # Only read the columns this run uses, with features downcast to float32
+            columns, _ = run_columns(config)
+            df = load_dataset(data_path, columns=columns, keep_dtypes=[label], cache_dir=cache_dir)
+    dataset_name = os.path.basename(data_path).split('.')[0].split('_tr')[0]
+    fingerprint = data_fingerprint(data_path, cache_dir)
 
-    if run_regionally == 'Yes':
-        loc_type='local'
-        if region_id in ['SW', 'EM', 'EE', 'WA', 'SE', 'NW', 'YH', 'WM', 'LN', 'NE']:
-            train_data = df[df['region']!=region_id]
-            test_data = df[df['region']==region_id]
+    # Splits are shared row-index files, so every run of a sweep sees identical rows
+    with tracer.span('split'):
+        if run_regionally == 'Yes':
+            loc_type='local'
+            if region_id in REGIONS:
+                train_idx, test_idx = region_split(df['region'], region_id, fingerprint, cache_dir)
+            else:
+                raise Exception('Region not correct')
         else:
-            raise Exception('Region not correct')
-    else:
-        loc_type= 'global'
-        region_id= None
-        train_data, test_data = train_test_split(df, test_size=0.2, random_state=42)
-    train_data = transform(TabularDataset(train_data), label, column_setting, setting_dir)
+            loc_type= 'global'
+            region_id= None
+            train_idx, test_idx = global_split(len(df), fingerprint, cache_dir)
+        # Drop rows without a label before any subsetting, as transform() would
+        has_label = df[label].notna().to_numpy()
+        train_idx = train_idx[has_label[train_idx]]
         
     print(f'starting model run for {loc_type} target {label}, time lim {time_limit}, col setting {column_setting}, model preset {model_preset} and train subset {train_subset_prop}' )
 
     
-    output_directory = f"{output_path}/{dataset_name}__{loc_type}__{label}__{time_limit}__colset_{column_setting}__{model_preset}___tsp_{train_subset_prop}__{model_types}__{region_id}"
+    output_directory = get_output_directory(config)
     required_files = ['model_summary.txt'] 
+    run_info = {'dataset_name': dataset_name, 'loc_type': loc_type, 'label': label, 'time_limit': time_limit,
+                'col_setting': column_setting, 'model_preset': model_preset, 'train_subset_prop': train_subset_prop,
+                'model_types': model_types, 'region': str(region_id)}
+    manifest = RunManifest.load(output_path, config, fingerprint, output_directory, run_info)
+    stages = ['fit', 'predict', 'leaderboard']
+    if column_setting== 39: 
+        # run feature importance only for the all vars excl census
+        stages.append('feature_importance')
     
     
-    # Check if output directory exists and has all required files
-    if check_directory_and_files(output_directory, required_files):
+    # Runs made before the manifest existed are complete once their summary is written
+    if not manifest.record['stages'] and check_directory_and_files(output_directory, required_files):
         print(f"Directory {output_directory} already contains all necessary files. Exiting to prevent data overwrite.")
-        sys.exit(0)
-    else:
-        # Create directory if it doesn't exist
-        os.makedirs(output_directory, exist_ok=True)
-        print(f"Directory {output_directory} is ready for use.")
+        return output_directory
+    stale_stages = manifest.stale_stages(stages)
+    if not stale_stages:
+        print(f"All stages for run {manifest.key} in {output_directory} are up to date.")
+        return output_directory
+    # Create directory if it doesn't exist
+    os.makedirs(output_directory, exist_ok=True)
+    print(f"Directory {output_directory} is ready for use, running stages {stale_stages} for run {manifest.key}.")
 
     
     # Reduce the training dataset if needed
     if train_subset_prop != 1:
-        train_subset, _ = train_test_split(train_data, test_size=1-train_subset_prop, random_state=42)
-       
-    else:
-        train_subset = train_data   
+        with tracer.span('split'):
+            train_idx = subset_split(train_idx, train_subset_prop, f'{loc_type}_{region_id}_{label}', fingerprint, cache_dir)
+    with tracer.span('tabular_dataset'):
+        train_subset = TabularDataset(transform(df, label, column_setting, setting_dir, rows=train_idx))
     size_train = len(train_subset) 
-    predictor = TabularPredictor(label, path=output_directory).fit(train_subset, 
-                                                                time_limit=time_limit,
-                                                                presets=model_preset,
-                                                                excluded_model_types=excl_models)
+    summary = {'run_key': manifest.key, 'config': config, 'run_info': run_info, 'data_fingerprint': fingerprint}
+    if 'fit' in stale_stages:
+        # Presets only fill in fit arguments that are absent, so hyperparameters are passed
+        # only when a regional fold reuses the global run's models
+        fit_kwargs = {}
+        hyperparameters = warm_start_hyperparameters(warm_start) if warm_start else None
+        if hyperparameters is not None:
+            fit_kwargs['hyperparameters'] = hyperparameters
+        with tracer.span('fit'):
+            predictor = TabularPredictor(label, path=output_directory).fit(train_subset, 
+                                                                        time_limit=time_limit,
+                                                                        presets=model_preset,
+                                                                        excluded_model_types=excl_models,
+                                                                        num_cpus=num_cpus,
+                                                                        **fit_kwargs)
+        manifest.mark_done('fit', ['predictor.pkl'])
+    else:
+        predictor = TabularPredictor.load(output_directory)
     
-    test_data = transform(TabularDataset(test_data), label, column_setting, setting_dir)
-    test_data.to_csv(os.path.join(output_directory, 'test_data.csv'), index=False)
-    y_pred = predictor.predict(test_data.drop(columns=[label]))
-    results = predictor.evaluate_predictions(y_true=test_data[label], y_pred=y_pred, auxiliary_metrics=True)
-    size_test = len(test_data)
+    with tracer.span('tabular_dataset'):
+        test_data = TabularDataset(transform(df, label, column_setting, setting_dir, rows=test_idx))
+    if not manifest.is_fresh('predict'):
+        with tracer.span('predict'):
+            test_data.to_csv(os.path.join(output_directory, 'test_data.csv'), index=False)
+            y_pred = predictor.predict(test_data.drop(columns=[label]))
+        with tracer.span('evaluate'):
+            results = predictor.evaluate_predictions(y_true=test_data[label], y_pred=y_pred, auxiliary_metrics=True)
+        # Plain floats, so the summary reads back the same whatever numpy version wrote it
+        results = {k: float(v) for k, v in results.items()}
+        size_test = len(test_data)
 
-    
-    print(results)
-    sizett = {'len_train' :size_train, 'len_test':size_test  }
-    results.update(sizett)
+        
+        print(results)
+        sizett = {'len_train' :size_train, 'len_test':size_test  }
+        save_summary({**summary, 'metrics': dict(results), **sizett, 'timings': tracer.durations()}, output_directory)
+        results.update(sizett)
 
-    save_results(results, output_directory)
-    res = predictor.leaderboard(test_data)
-    res.to_csv(os.path.join(output_directory, 'leaderboard_results.csv'))
+        save_results(results, output_directory)
+        manifest.mark_done('predict', ['test_data.csv', 'model_summary.txt', 'model_summary.json'])
 
-    if column_setting== 39: 
-        # run feature importance only for the all vars excl census
-        pred = predictor.feature_importance(test_data)
-        pred.to_csv(os.path.join(output_directory, 'feature_importance.csv'))
+    if not manifest.is_fresh('leaderboard'):
+        with tracer.span('leaderboard'):
+            res = predictor.leaderboard(test_data)
+            res.to_csv(os.path.join(output_directory, 'leaderboard_results.csv'))
+        manifest.mark_done('leaderboard', ['leaderboard_results.csv'])
+
+    if 'feature_importance' in stages and not manifest.is_fresh('feature_importance'):
+        with tracer.span('feature_importance'):
+            pred = predictor.feature_importance(test_data)
+            pred.to_csv(os.path.join(output_directory, 'feature_importance.csv'))
+        manifest.mark_done('feature_importance', ['feature_importance.csv'])
 
+    save_summary({**summary, 'timings': tracer.durations(), **peak_rss_mb()}, output_directory)
+    tracer.save(output_directory)
+    return output_directory
+
+
+def valid_configs(configs):
+    """
+    The configs whose target and column setting exist. The others are reported and
+    dropped, so one bad entry does not stop the rest of a sweep.
+    """
+    valid = []
+    for config in configs:
+        try:
+            run_columns(config)
+        except Exception as e:
+            print(f"Skipping run with target {config['TARGET']} and col setting {config['COL_SETTING']}: {e!r}")
+            continue
+        valid.append(config)
+    return valid
+
+
+def run_sweep(configs):
+    """
+    Load the data once per input file and train every config on a shared worker pool.
+    Workers are forked from this process, so they all read the one loaded frame and split.
+    """
+    configs = valid_configs(configs)
+    for data_path in dict.fromkeys(config['DATA_PATH'] for config in configs):
+        path_configs = [config for config in configs if config['DATA_PATH'] == data_path]
+        columns, labels = [], []
+        for config in path_configs:
+            run_cols, label = run_columns(config)
+            columns += run_cols
+            labels.append(label)
+        df = load_dataset(data_path, columns=columns, keep_dtypes=labels)
+        prepare_splits(df, data_fingerprint(data_path))
+        # Resolve every column setting before forking, so the workers inherit the registry
+        registry = get_registry(df)
+        for config in path_configs:
+            registry.resolve(int(config['COL_SETTING']), get_setting_dict(config['run_census']), get_label(config['TARGET']))
+        # Warm-start hyperparameters are read from each global run once, and inherited by the folds
+        for warm_start in dict.fromkeys(config['WARM_START'] for config in path_configs if config.get('WARM_START')):
+            warm_start_hyperparameters(warm_start)
+        run_jobs(run_model, path_configs, df)
+
+
+def main():
+    config = config_from_env()
+    # COL_SETTINGS and TARGETS (comma separated) train several predictors from one load of the data
+    col_settings, targets = env_list('COL_SETTINGS'), env_list('TARGETS')
+    # REGIONAL_CV=Yes trains every leave-one-region-out fold of each config side by side
+    regional_cv = os.environ.get('REGIONAL_CV') == 'Yes'
+    if col_settings or targets or regional_cv:
+        configs = sweep_configs(config, col_settings, targets)
+        if regional_cv:
+            configs = [fold for base_config in configs for fold in regional_cv_configs(base_config)]
+        run_sweep(configs)
+    else:
+        run_model(config)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,19 @@
+import os
+
+from src.distill import build_fast_model
+
+
+def main():
+    model_path = os.environ.get('MODEL_PATH')
+    variant = os.environ.get('MODEL_VARIANT', 'distill')
+    time_limit = int(os.environ.get('TIME_LIM', 3600))
+
+    if model_path is None:
+        raise ValueError('MODEL_PATH must be set')
+
+    print(f'Building {variant} surrogate for {model_path}')
+    build_fast_model(model_path, variant=variant, time_limit=time_limit)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,16 @@
 import os
 import subprocess
 
+from run_automl import run_sweep, sweep_configs, regional_cv_configs
+
 def set_environment_vars(vars_dict):
     os.environ.update(vars_dict)
 
 def run_python_script(script_name):
     subprocess.run(['python', script_name])
 
-def run_model_experiments():
+
+def model_experiment_configs():
     base_config = {
         'OUTPUT_PATH': './results/model_results',
         'DATA_PATH': './input_data/NEBULA_englandwales_domestic_filtered.csv',
@@ -16,19 +19,13 @@ def run_model_experiments():
         'TRAIN_SUBSET_PROP': '1',
         'MODEL_TYPES': 'all',
         'RUN_REGIONAL': 'No',
-        'run_census': 'No'
+        'run_census': 'No',
+        'REGION_ID': None
     }
-    set_environment_vars(base_config)
 
-    for target in ['totalelec', 'totalgas']:
-        for col_setting in [18, 39, 42, 43, 52]:
-            set_environment_vars({
-                'COL_SETTING': str(col_setting),
-                'TARGET': target
-            })
-            run_python_script('run_automl.py')
+    return sweep_configs(base_config, [18, 39, 42, 43, 52], ['totalelec', 'totalgas'])
 
-def run_regional_experiments():
+def regional_experiment_configs():
     regional_config = {
         'OUTPUT_PATH': './results/regional_results',
         'DATA_PATH': './input_data/NEBULA_englandwales_domestic_filtered.csv',
@@ -40,16 +37,18 @@ def run_regional_experiments():
         'RUN_REGIONAL': 'Yes',
         'run_census': 'No'
     }
-    set_environment_vars(regional_config)
 
-    regions = ['EE', 'WA', 'SE', 'NW', 'YH', 'WM', 'LN', 'NE', 'SW', 'EM']
+    # Folds warm start from the colset 52 global runs in model_results when they exist
+    configs = []
     for target in ['totalelec', 'totalgas']:
-        for region in regions:
-            set_environment_vars({
-                'REGION_ID': region,
-                'TARGET': target
-            })
-            run_python_script('run_automl.py')
+        configs += regional_cv_configs(dict(regional_config, TARGET=target))
+    return configs
+
+def run_model_experiments():
+    run_sweep(model_experiment_configs())
+
+def run_regional_experiments():
+    run_sweep(regional_experiment_configs())
 
 def extract_results():
     for folder in ['model_results', 'regional_results']:
@@ -60,7 +59,8 @@ def run_sobol_experiments():
     sobol_config = {
         'COL_SETTING': '52',
         'GROUPED': 'False',
-        'N': '65536'
+        'N': '65536',
+        'ADAPTIVE': 'False'
     }
     set_environment_vars(sobol_config)
 
@@ -76,10 +76,9 @@ def main():
     for subdir in subdirs:
         os.makedirs(os.path.join(base_dir, subdir), exist_ok=True)
 
-    print('Starting experiments...')
+    print('Starting global and region experiments...')
+    # The regional folds reuse the global models, so the global runs go first
     run_model_experiments()
-    
-    print('Starting region experiments')
     run_regional_experiments()
     
     print("Extracting ML results")
@@ -1,6 +1,9 @@
 import os
+import sys
 import json
 import time
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
@@ -9,11 +12,19 @@ from SALib.sample import saltelli
 from SALib.analyze import sobol
 from autogluon.tabular import TabularPredictor
 import seaborn as sns 
+from threadpoolctl import threadpool_limits
 
 from src.problem_definitions import problem_minimum
-from src.sobol import remove_groups_from_problem, run_sobol_analysis, save_results_to_csv_sobol, plot_sobol_heatmap, plot_sobol_indices
+from src.sobol import remove_groups_from_problem, get_saltelli_sample, run_sobol_analysis, run_sobol_analysis_adaptive, save_results_to_csv_sobol, plot_sobol_heatmap, plot_sobol_indices
 
 from src.sobol_post_process import analyse_sobol_single
+from src.manifest import find_manifest
+from src.distill import resolve_model_path
+from src.prediction_cache import PredictionCache
+from src.given_data import given_data_indices
+from src.problem_bounds import load_problem
+from src.profiling import Tracer, rollup_traces
+from src.inference import feature_columns
 
 # Define regions to analyze
 REGIONS = ['SE', 'LN', 'SW', 'EE', 'EM', 'YH', 'WM', 'NE', 'NW', 'WA']
@@ -25,13 +36,54 @@ folder = 'model_results'
 dataset_name = 'NEBULA_englandwales_domestic_filtered'
 
 N = int(os.getenv('N', 65536))
+# Adaptive mode doubles the sample from N0 until the confidence intervals are below SOBOL_TOL,
+# with N as the upper limit
+adaptive = os.getenv('ADAPTIVE', 'False') == 'True'
+N0 = int(os.getenv('N0', 1024))
+sobol_tol = float(os.getenv('SOBOL_TOL', 0.01))
+max_predictions = int(os.getenv('MAX_PREDICTIONS')) if os.getenv('MAX_PREDICTIONS') else None
+# Given-data mode estimates S1/ST from the global model's test rows of each region instead of
+# a Saltelli sample; results land in an Ngiven_bins{N_BINS} folder next to the sampled ones
+given_data = os.getenv('GIVEN_DATA', 'False') == 'True'
+n_bins = int(os.getenv('N_BINS', 20))
+# SECOND_ORDER=False samples N*(D+2) rows for S1/ST only instead of N*(2D+2) with S2
+calc_second_order = os.getenv('SECOND_ORDER', 'True') == 'True'
+# The sampling design names the N{sample_label} result folder and the manifest stage, so runs
+# with another design (adaptive, S1/ST only, given data with other bins) never overwrite or shadow each other
+if given_data:
+    sample_label = f'given_bins{n_bins}'
+else:
+    sample_label = f'{N}'
+    if adaptive:
+        sample_label += f'_adaptive_N0{N0}_tol{sobol_tol}' + (f'_max{max_predictions}' if max_predictions else '')
+    if not calc_second_order:
+        sample_label += '_S1ST'
 col_setting = int(os.getenv('COL_SETTING'))
 time_lim = 15000 
 
 region = 'None'
+# 'full' uses the trained ensemble, 'refit' or 'distill' a fast surrogate from run_distill.py
+model_variant = os.getenv('MODEL_VARIANT', 'full')
+output_folder = folder if model_variant == 'full' else f'{folder}_{model_variant}'
+# Per-region problems from run_problem_bounds.py replace the bounds of problem_minimum;
+# their results are kept under <folder>_<problem dir name>
+problem_dir = os.getenv('PROBLEM_DIR')
+if problem_dir:
+    output_folder = f'{output_folder}_{os.path.basename(os.path.normpath(problem_dir))}'
 label = os.getenv('LABEL')
 if label is None:
     raise ValueError('No target')
+# Regions run concurrently in forked workers that share the driver's predictor and sample
+n_workers = int(os.getenv('N_WORKERS', min(len(REGIONS), os.cpu_count())))
+# The model libraries' thread pools are capped so the workers share the cores instead of each using all of them
+threads_per_worker = max(1, os.cpu_count() // n_workers)
+THREAD_ENV_VARS = ['OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS']
+
+# Memoise predictions so reruns with the same model, sample and region skip predict
+use_prediction_cache = os.getenv('PREDICTION_CACHE', 'on') == 'on'
+
+_PREDICTOR = None
+_GIVEN_DATA = None
 
 
 def get_model_path(folder, dataset_name, label, time_lim, col_setting, region):
@@ -39,33 +91,59 @@ def get_model_path(folder, dataset_name, label, time_lim, col_setting, region):
 
 def get_output_path(label, region_id, folder, col_setting, grouped):
     base = f'{BASE_OUTPUT_PATH}/{label}/{region_id}/{folder}/colset_{col_setting}'
-    return os.path.join(base, 'grouped' if grouped else 'ungrouped', f'N{N}')
+    return os.path.join(base, 'grouped' if grouped else 'ungrouped', f'N{sample_label}')
        
 def process_region(region_id, problem, grouped, folder, col_setting, label):
     print(f"\nProcessing region: {region_id}")
     start_time = time.time()
     
     # Create output directory
-    result_folder = get_output_path(label, region_id, folder, col_setting, grouped)
+    result_folder = get_output_path(label, region_id, output_folder, col_setting, grouped)
     os.makedirs(result_folder, exist_ok=True)
     
-    # Get model path and load predictor
+    # Skip regions whose results are newer than the model they were computed from
     model_path = get_model_path(folder, dataset_name, label, time_lim, col_setting, region)
-    print(f'Loading predictor for region {region_id}')
-    predictor = TabularPredictor.load(model_path, require_version_match=True)
+    manifest = find_manifest(model_path)
+    stage = f"sobol:{region_id}:{output_folder}:N{sample_label}:{'grouped' if grouped else 'ungrouped'}:{'S2' if calc_second_order else 'S1ST'}"
+    if manifest is not None and manifest.is_fresh(stage):
+        print(f'Sobol results for region {region_id} are up to date, skipping')
+        return None
+
+    # Every region uses the same global model and sample matrix, loaded once by the driver
+    tracer = Tracer(f'run_gsa_{region_id}')
+    predictor = load_predictor()
+    cache = PredictionCache(predictor.path) if use_prediction_cache else None
     
     # Run analysis
-    print(f'Starting Sobol analysis for region {region_id} with N={N}')
-    sobol_results = run_sobol_analysis(N, predictor, region_id, problem)
+    if given_data:
+        test_data = load_given_data()
+        X = test_data[test_data['region'] == region_id].drop(columns=[label])
+        print(f'Starting given-data analysis for region {region_id} on {len(X)} test rows')
+        with tracer.span('given_data'):
+            sobol_results = given_data_indices(predictor, X, problem['names'], n_bins=n_bins, cache=cache)
+    elif adaptive:
+        print(f'Starting adaptive Sobol analysis for region {region_id} from N={N0} up to N={N}')
+        sobol_results, trace = run_sobol_analysis_adaptive(N, predictor, region_id, problem, N0=N0, tol=sobol_tol,
+                                                           max_predictions=max_predictions, cache=cache,
+                                                           calc_second_order=calc_second_order, tracer=tracer)
+        trace.to_csv(os.path.join(result_folder, 'convergence_trace.csv'), index=False)
+    else:
+        print(f'Starting Sobol analysis for region {region_id} with N={N}')
+        with tracer.span('sample'):
+            param_values = get_saltelli_sample(problem, N, calc_second_order=calc_second_order)
+        sobol_results = run_sobol_analysis(N, predictor, region_id, problem, param_values, cache, calc_second_order,
+                                           tracer=tracer)
     
     # Save results
     print(f'Saving results for region {region_id}')
-    s1_data, st_data = save_results_to_csv_sobol(sobol_results, result_folder, problem)
+    with tracer.span('save'):
+        s1_data, st_data = save_results_to_csv_sobol(sobol_results, result_folder, problem)
     
     # Create plots
     group_map = None
-    plot_sobol_heatmap(sobol_results, result_folder, problem, group_map)
-    plot_sobol_indices(s1_data, st_data, result_folder, problem, group_map)
+    with tracer.span('plot'):
+        plot_sobol_heatmap(sobol_results, result_folder, problem, group_map)
+        plot_sobol_indices(s1_data, st_data, result_folder, problem, group_map)
     
     # Save problem configuration
     with open(os.path.join(result_folder, 'problem_config.json'), 'w') as f:
@@ -75,11 +153,67 @@ def process_region(region_id, problem, grouped, folder, col_setting, label):
     execution_time = time.time() - start_time
     with open(os.path.join(result_folder, 'execution_time.txt'), 'w') as f:
         f.write(f"Execution time: {execution_time:.2f} seconds")
+    tracer.save(result_folder)
     
+    if manifest is not None:
+        outputs = [os.path.abspath(os.path.join(result_folder, f)) for f in ['sobol_S1_results.csv', 'sobol_ST_results.csv']]
+        manifest.mark_done(stage, outputs)
     print(f"Completed analysis for region {region_id} in {execution_time:.2f} seconds")
     return execution_time
 
 
+def load_predictor():
+    global _PREDICTOR
+    if _PREDICTOR is None:
+        model_path = resolve_model_path(get_model_path(folder, dataset_name, label, time_lim, col_setting, region), model_variant)
+        print(f'Loading predictor from {model_path}')
+        _PREDICTOR = TabularPredictor.load(model_path, require_version_match=True)
+    return _PREDICTOR
+
+
+def load_given_data():
+    global _GIVEN_DATA
+    if _GIVEN_DATA is None:
+        # The test rows always come from the trained run folder, also when a surrogate is used
+        model_path = get_model_path(folder, dataset_name, label, time_lim, col_setting, region)
+        _GIVEN_DATA = pd.read_csv(os.path.join(model_path, 'test_data.csv'))
+        if 'region' not in _GIVEN_DATA.columns:
+            raise ValueError(f'Column setting {col_setting} has no region column, given-data mode needs it')
+    return _GIVEN_DATA
+
+
+def check_problem_columns(problems):
+    """
+    Check every problem only varies features of the model's column setting, before any
+    sample is predicted. Features the problem leaves unset are reported.
+    """
+    features = feature_columns(col_setting, label=label)
+    for region_id, region_problem in problems.items():
+        unknown = [name for name in region_problem['names'] if name not in features]
+        if unknown:
+            raise KeyError(f'Problem for {region_id} varies columns not in column setting {col_setting}: {unknown}')
+    unset = [col for col in features if col != 'region' and col not in problems[REGIONS[0]]['names']]
+    if unset:
+        print(f'Features not varied by the problem: {unset}')
+
+
+def limit_threads(n_threads):
+    """
+    Cap the OpenMP and BLAS pools (LightGBM, XGBoost, numpy) and torch of a region worker at n_threads.
+    """
+    threadpool_limits(limits=n_threads)
+    if 'torch' in sys.modules:
+        sys.modules['torch'].set_num_threads(n_threads)
+
+
+def run_region(region_id, problem, grouped):
+    try:
+        return process_region(region_id, problem, grouped, folder, col_setting, label)
+    except Exception as e:
+        print(f"Error processing region {region_id}: {e}")
+        return -1  # Mark failed regions
+
+
 def main():
 
     # Initialize problem definition
@@ -94,34 +228,61 @@ def main():
     print('bounds:', problem['bounds'])
     print('keys:', problem.keys())
     
+    problems = {region_id: problem for region_id in REGIONS}
+    if problem_dir:
+        for region_id in REGIONS:
+            problems[region_id] = load_problem(problem_dir, region_id)
+            if not grouped:
+                problems[region_id] = remove_groups_from_problem(problems[region_id])
+            print(f'{region_id} bounds:', problems[region_id]['bounds'])
+
     # Process all regions
     total_start_time = time.time()
     execution_times = {}
     
-    for region_id in REGIONS:
-        try:
-            execution_times[region_id] = process_region(
-                region_id, problem, grouped, folder, col_setting, label
-            )
-        except Exception as e:
-            print(f"Error processing region {region_id}: {e}")
-            execution_times[region_id] = -1  # Mark failed regions
+    # Load the model and draw the sample once, before any worker is forked
+    load_predictor()
+    if not grouped:
+        check_problem_columns(problems)
+    if given_data:
+        load_given_data()
+    elif not adaptive:
+        for region_problem in problems.values():
+            get_saltelli_sample(region_problem, N, calc_second_order=calc_second_order)
+    if n_workers > 1:
+        # Set before forking for libraries that only read them when they start their pools
+        os.environ.update({var: str(threads_per_worker) for var in THREAD_ENV_VARS})
+        print(f'Analysing regions on {n_workers} workers with {threads_per_worker} threads each')
+        with ProcessPoolExecutor(n_workers, mp_context=mp.get_context('fork'), initializer=limit_threads,
+                                 initargs=(threads_per_worker,)) as pool:
+            futures = {region_id: pool.submit(run_region, region_id, problems[region_id], grouped) for region_id in REGIONS}
+            for region_id, future in futures.items():
+                execution_times[region_id] = future.result()
+    else:
+        for region_id in REGIONS:
+            execution_times[region_id] = run_region(region_id, problems[region_id], grouped)
     
     # Save summary of execution times
     total_time = time.time() - total_start_time
     summary_path = os.path.join(BASE_OUTPUT_PATH, label, 'execution_summary.txt')
+    os.makedirs(os.path.dirname(summary_path), exist_ok=True)
     
     with open(summary_path, 'w') as f:
         f.write(f"Total execution time: {total_time:.2f} seconds\n\n")
         f.write("Region-wise execution times:\n")
         for region_id, exec_time in execution_times.items():
-            status = f"{exec_time:.2f} seconds" if exec_time > 0 else "FAILED"
+            if exec_time is None:
+                status = "up to date"
+            else:
+                status = f"{exec_time:.2f} seconds" if exec_time > 0 else "FAILED"
             f.write(f"{region_id}: {status}\n")
     
     print(f"\nAnalysis completed for all regions in {total_time:.2f} seconds")
     print(f"Execution summary saved to {summary_path}") 
+    rollup_traces(os.path.join(BASE_OUTPUT_PATH, label))
 
-    analyse_sobol_single(BASE_PATH=BASE_OUTPUT_PATH , TARGET_VAR=label, N=N, MODEL_FOLDER=folder, COLSET=col_setting) 
+    analyse_sobol_single(BASE_PATH=BASE_OUTPUT_PATH , TARGET_VAR=label, N=sample_label, MODEL_FOLDER=output_folder, COLSET=col_setting,
+                         BASE_FOLDER=folder) 
 
 if __name__ == "__main__":
     main()  
\ No newline at end of file
@@ -0,0 +1,24 @@
+import os
+
+from src.problem_definitions import problem_minimum
+from src.problem_bounds import write_region_problems
+
+
+def main():
+    data_path = os.environ.get('DATA_PATH')
+    problem_dir = os.environ.get('PROBLEM_DIR', './results/problems/data_bounds')
+    mode = os.environ.get('PROBLEM_MODE', 'bounds')
+    lower_q = float(os.environ.get('LOWER_Q', 0.01))
+    upper_q = float(os.environ.get('UPPER_Q', 0.99))
+    size = int(os.environ.get('RESERVOIR_SIZE', 100000))
+
+    if data_path is None:
+        raise ValueError('DATA_PATH must be set')
+
+    print(f'Deriving {mode} problem definitions from {data_path} into {problem_dir}')
+    write_region_problems(data_path, problem_dir, problem_minimum, mode=mode, lower_q=lower_q, upper_q=upper_q,
+                          size=size)
+
+
+if __name__ == '__main__':
+    main()
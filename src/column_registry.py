@@ -0,0 +1,124 @@
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.column_settings import settings_dict, settings_col_dict_census
+
+SETTING_DICTS = {'default': settings_dict, 'census': settings_col_dict_census}
+
+_REGISTRIES = {}
+
+
+def _setting_dict_name(setting_dict):
+    for name, candidate in SETTING_DICTS.items():
+        if candidate is setting_dict:
+            return name
+    raise ValueError('Unknown setting dict, register it in SETTING_DICTS')
+
+
+class ColumnSet:
+    """
+    A column setting resolved against one dataset schema: the column names in
+    model order, their positions in the schema and their dtypes.
+    """
+
+    def __init__(self, name, columns, positions, dtypes):
+        self.name = name
+        self.columns = columns
+        self.positions = positions
+        self.dtypes = dtypes
+
+    def __len__(self):
+        return len(self.columns)
+
+    def project_table(self, table):
+        """
+        The columns of an Arrow table with this schema; Arrow selects without copying buffers.
+        """
+        return table.select(self.positions.tolist())
+
+    def project_frame(self, df):
+        """
+        The columns of a DataFrame with this schema, selected by position. With pandas
+        copy-on-write this is a lazy view of the shared frame.
+        """
+        return df.iloc[:, self.positions]
+
+    def project_array(self, X):
+        """
+        The columns of a 2D array laid out like the schema. A contiguous run of
+        positions is returned as a view, anything else as a copy.
+        """
+        positions = self.positions
+        if len(positions) and np.all(np.diff(positions) == 1):
+            return X[:, positions[0]:positions[-1] + 1]
+        return X[:, positions]
+
+
+class ColumnRegistry:
+    """
+    Column settings resolved once per dataset schema. Each setting is checked against the
+    schema when first requested, and its positions and dtypes are cached for later runs.
+    """
+
+    def __init__(self, names, dtypes):
+        self.names = list(names)
+        self.dtypes = dict(zip(self.names, dtypes))
+        self._positions = {name: i for i, name in enumerate(self.names)}
+        self._resolved = {}
+
+    @classmethod
+    def from_schema(cls, schema):
+        return cls(schema.names, [str(field.type) for field in schema])
+
+    @classmethod
+    def from_frame(cls, df):
+        return cls(df.columns, [str(dtype) for dtype in df.dtypes])
+
+    @classmethod
+    def from_parquet(cls, path):
+        return cls.from_schema(pq.read_schema(path))
+
+    def resolve(self, col_setting, setting_dict=settings_dict, label=None):
+        """
+        The ColumnSet for a column setting, with the label appended when given.
+        Raises KeyError listing every column of the setting missing from the schema.
+        """
+        key = (_setting_dict_name(setting_dict), col_setting, label)
+        if key not in self._resolved:
+            columns = list(dict.fromkeys(setting_dict[col_setting][1] + ([label] if label is not None else [])))
+            missing = [col for col in columns if col not in self._positions]
+            if missing:
+                raise KeyError(f'Column setting {col_setting} needs columns missing from the data: {missing}')
+            positions = np.array([self._positions[col] for col in columns], dtype=np.intp)
+            self._resolved[key] = ColumnSet(setting_dict[col_setting][0], columns, positions,
+                                            [self.dtypes[col] for col in columns])
+        return self._resolved[key]
+
+    def validate(self, setting_dict=settings_dict):
+        """
+        Resolve every setting of setting_dict. Returns {col_setting: missing columns}
+        for the settings this schema cannot serve.
+        """
+        invalid = {}
+        for col_setting, (_, columns) in setting_dict.items():
+            try:
+                self.resolve(col_setting, setting_dict)
+            except KeyError:
+                invalid[col_setting] = [col for col in columns if col not in self._positions]
+        return invalid
+
+
+def get_registry(data):
+    """
+    Shared registry for the schema of a DataFrame or Arrow table, so repeated runs
+    over the same loaded data resolve each setting once.
+    """
+    if isinstance(data, (pa.Table, pa.RecordBatch)):
+        names, dtypes = data.schema.names, [str(field.type) for field in data.schema]
+    else:
+        names, dtypes = list(data.columns), [str(dtype) for dtype in data.dtypes]
+    key = (tuple(names), tuple(dtypes))
+    if key not in _REGISTRIES:
+        _REGISTRIES[key] = ColumnRegistry(names, dtypes)
+    return _REGISTRIES[key]
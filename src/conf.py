@@ -1,37 +1,29 @@
 import pandas as pd 
 import numpy as np 
 
+# Categories in code order; missing inputs are 'Not Applicable'
+CONFIDENCE_LEVELS = ['High', 'Medium', 'Low', 'Very Low', 'Not Applicable']
+
+
+def floor_area_confidence_codes(a, b):
+    """
+    int8 code into CONFIDENCE_LEVELS for each pair of floor areas: High within 3%,
+    Medium within 10%, Low within 25% of the larger area, Very Low otherwise.
+    """
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pct_diff = np.abs(a - b) / np.maximum(a, b) * 100
+    codes = np.select([pct_diff <= 3, pct_diff <= 10, pct_diff <= 25], [0, 1, 2], default=3).astype(np.int8)
+    codes[np.isnan(a) | np.isnan(b)] = 4
+    return codes
+
+
 def calculate_floor_area_confidence(df, col1, col2):
-    df['confidence_floor_area'] = np.where(
-        df[col1].isna() | df[col2].isna(),
-        'Not Applicable',
-        None
-    )
-    
-    valid_rows = ~df['confidence_floor_area'].eq('Not Applicable')
-    
-    if valid_rows.any():
-        valid_df = df[valid_rows].copy()
-        
-        valid_df['floor_area_diff'] = abs(valid_df[col1] - valid_df[col2])
-        valid_df['floor_area_pct_diff'] = (
-            valid_df['floor_area_diff'] / 
-            valid_df[[col1, col2]].max(axis=1) * 100
-        )
-        
-        conditions = [
-            (valid_df['floor_area_pct_diff'] <= 3),    
-            (valid_df['floor_area_pct_diff'] <= 10),   
-            (valid_df['floor_area_pct_diff'] <= 25)    
-        ]
-        choices = ['High', 'Medium', 'Low']
-        
-        valid_df['confidence_floor_area'] = np.select(
-            conditions,
-            choices,
-            default='Very Low'
-        )
-        
-        df.loc[valid_rows, 'confidence_floor_area'] = valid_df['confidence_floor_area']
-    
-    return df
\ No newline at end of file
+    """
+    Add confidence_floor_area, how well two floor area estimates agree, as a categorical
+    with the CONFIDENCE_LEVELS labels. Works on any chunk of rows independently.
+    """
+    codes = floor_area_confidence_codes(df[col1].to_numpy(), df[col2].to_numpy())
+    df['confidence_floor_area'] = pd.Categorical.from_codes(codes, categories=CONFIDENCE_LEVELS)
+    return df
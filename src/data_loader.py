@@ -0,0 +1,177 @@
+import os
+import json
+import hashlib
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.column_settings import settings_dict
+
+# Typed columnar copies of the input CSVs live here, one Parquet file per data version
+CACHE_DIR = os.environ.get('DATA_CACHE_DIR', './input_data/cache')
+HASH_BLOCK_SIZE = 1 << 24
+CATEGORICAL_COLUMNS = ['region', 'confidence_floor_area']
+
+
+def _hash_file(data_path):
+    h = hashlib.blake2b(digest_size=16)
+    with open(data_path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def data_fingerprint(data_path, cache_dir=CACHE_DIR):
+    """
+    Return a content hash for the data file.
+
+    The full hash is only computed when the file size or mtime changes; otherwise
+    it is read back from a small sidecar file in the cache directory.
+    """
+    stat = os.stat(data_path)
+    dataset_name = os.path.basename(data_path).split('.')[0]
+    sidecar = os.path.join(cache_dir, f'{dataset_name}.fingerprint.json')
+    if os.path.exists(sidecar):
+        with open(sidecar, 'r') as f:
+            record = json.load(f)
+        if record['size'] == stat.st_size and record['mtime_ns'] == stat.st_mtime_ns:
+            return record['hash']
+
+    file_hash = _hash_file(data_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f'{sidecar}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'hash': file_hash}, f)
+    os.replace(tmp_path, sidecar)
+    return file_hash
+
+
+def get_cache_path(data_path, cache_dir=CACHE_DIR):
+    dataset_name = os.path.basename(data_path).split('.')[0]
+    return os.path.join(cache_dir, f'{dataset_name}__{data_fingerprint(data_path, cache_dir)}.parquet')
+
+
+def build_cache(data_path, cache_dir=CACHE_DIR):
+    """
+    Parse the CSV once and write it to a typed Parquet file keyed by its fingerprint.
+    Older caches of the same dataset are removed.
+    """
+    cache_path = get_cache_path(data_path, cache_dir)
+    if os.path.exists(cache_path):
+        return cache_path
+
+    print(f'Building columnar cache for {data_path}')
+    df = pd.read_csv(data_path, low_memory=False)
+    # Write to a private file first so concurrent runs never read a partial cache
+    tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, cache_path)
+
+    dataset_name = os.path.basename(data_path).split('.')[0]
+    for fname in os.listdir(cache_dir):
+        stale = os.path.join(cache_dir, fname)
+        if fname.startswith(f'{dataset_name}__') and fname.endswith('.parquet') and stale != cache_path:
+            os.remove(stale)
+    print(f'Cache written to {cache_path}')
+    return cache_path
+
+
+def required_columns(label, col_setting, setting_dict=settings_dict, run_regionally=False):
+    """
+    Work out which columns a run needs from its column setting.
+
+    Parameters:
+        label (str): The target column.
+        col_setting (int): Key into the setting dictionary.
+        setting_dict (dict): settings_dict or settings_col_dict_census.
+        run_regionally (bool): Whether the run splits on region.
+
+    Returns:
+        list: Column names without duplicates, in setting order.
+    """
+    cols = setting_dict[col_setting][1] + [label]
+    if run_regionally:
+        cols = cols + ['region']
+    return list(dict.fromkeys(cols))
+
+
+def _downcast_schema(schema, keep_dtypes):
+    fields = []
+    for field in schema:
+        if field.name in keep_dtypes:
+            fields.append(field)
+        elif field.name in CATEGORICAL_COLUMNS and pa.types.is_string(field.type):
+            fields.append(pa.field(field.name, pa.dictionary(pa.int32(), pa.string())))
+        elif pa.types.is_float64(field.type):
+            fields.append(pa.field(field.name, pa.float32()))
+        else:
+            fields.append(field)
+    return pa.schema(fields)
+
+
+def load_dataset(data_path, columns=None, downcast=True, keep_dtypes=(), cache_dir=CACHE_DIR):
+    """
+    Load the dataset through the columnar cache, reading only the requested columns.
+
+    Float columns are cast to float32 and region to a categorical before the
+    Arrow table is converted to pandas, so no float64 DataFrame is ever built.
+
+    Parameters:
+        data_path (str): Path to the source CSV (or an existing Parquet file).
+        columns (list): Columns to read; None reads every column.
+        downcast (bool): Whether to downcast dtypes.
+        keep_dtypes (list): Columns to leave at their stored dtype, e.g. the label.
+        cache_dir (str): Directory holding the Parquet caches.
+
+    Returns:
+        pd.DataFrame: The loaded data.
+    """
+    if columns is not None:
+        columns = list(dict.fromkeys(columns))
+
+    if data_path.endswith('.parquet'):
+        parquet_path = data_path
+    else:
+        parquet_path = build_cache(data_path, cache_dir)
+
+    table = pq.read_table(parquet_path, columns=columns)
+    if downcast:
+        table = table.cast(_downcast_schema(table.schema, set(keep_dtypes)))
+    return table.to_pandas(self_destruct=True)
+
+
+def downcast_frame(df, keep_dtypes=()):
+    """
+    Apply the same float32 / categorical downcasting as load_dataset to an in-memory frame.
+    """
+    dtypes = {}
+    for col, dtype in df.dtypes.items():
+        if col in keep_dtypes:
+            continue
+        if col in CATEGORICAL_COLUMNS and dtype == object:
+            dtypes[col] = 'category'
+        elif dtype == 'float64':
+            dtypes[col] = 'float32'
+    # astype with a dict gives every cast column its own block, so the result is
+    # consolidated with one copy instead of leaving hundreds of single-column blocks
+    return df.astype(dtypes).copy() if dtypes else df
+
+
+def iter_chunks(data_path, columns=None, chunksize=100000, downcast=True, keep_dtypes=()):
+    """
+    Stream a CSV or Parquet file as DataFrame chunks of at most chunksize rows,
+    reading only the requested columns.
+    """
+    if columns is not None:
+        columns = list(dict.fromkeys(columns))
+
+    if data_path.endswith('.parquet'):
+        parquet_file = pq.ParquetFile(data_path)
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+            chunk = batch.to_pandas()
+            yield downcast_frame(chunk, keep_dtypes) if downcast else chunk
+    else:
+        for chunk in pd.read_csv(data_path, usecols=columns, chunksize=chunksize):
+            if columns is not None:
+                chunk = chunk[columns]
+            yield downcast_frame(chunk, keep_dtypes) if downcast else chunk
@@ -0,0 +1,111 @@
+import os
+import json
+import time
+import shutil
+import pandas as pd
+from autogluon.tabular import TabularPredictor
+
+# Fast surrogates are kept outside the run folders so extraction never mistakes them for runs
+FAST_MODEL_DIR = './results/fast_models'
+VARIANTS = ['refit', 'distill']
+
+
+def get_fast_model_path(model_path, variant):
+    return os.path.join(FAST_MODEL_DIR, os.path.basename(os.path.normpath(model_path)), variant)
+
+
+def resolve_model_path(model_path, variant):
+    """
+    Return the predictor path for a model variant: 'full' is the trained
+    ensemble itself, 'refit' and 'distill' are surrogates made by build_fast_model.
+    """
+    if variant in (None, 'full'):
+        return model_path
+    if variant not in VARIANTS:
+        raise ValueError(f'Unknown model variant {variant}')
+    fast_path = get_fast_model_path(model_path, variant)
+    if not os.path.exists(fast_path):
+        raise FileNotFoundError(f'No {variant} surrogate at {fast_path}, run run_distill.py first')
+    return fast_path
+
+
+def _timed_predict(predictor, X):
+    start_time = time.time()
+    y_pred = predictor.predict(X)
+    return y_pred, time.time() - start_time
+
+
+def build_fast_model(model_path, variant='distill', time_limit=3600, hyperparameters=None):
+    """
+    Build a single fast model from a trained (stacked) predictor.
+
+    'refit' collapses the best model's bagged folds with refit_full. 'distill' trains a
+    student (LightGBM by default) on the teacher's predictions. The teacher's run
+    folder is left untouched: the work happens on a clone and only the chosen model
+    is kept, via clone_for_deployment.
+
+    Parameters:
+        model_path (str): Directory of the trained predictor; must contain test_data.csv.
+        variant (str): 'refit' or 'distill'.
+        time_limit (int): Time limit in seconds for distillation.
+        hyperparameters (dict): Student model hyperparameters for distillation.
+
+    Returns:
+        dict: The report written to distill_report.json in the surrogate directory.
+    """
+    if variant not in VARIANTS:
+        raise ValueError(f'Unknown model variant {variant}')
+    fast_path = get_fast_model_path(model_path, variant)
+    work_path = f'{fast_path}_work'
+    if os.path.exists(work_path):
+        shutil.rmtree(work_path)
+
+    teacher = TabularPredictor.load(model_path, require_version_match=True)
+    work = teacher.clone(path=work_path, return_clone=True)
+
+    if variant == 'refit':
+        # With set_best_to_refit_full the best model is already the refit one
+        work.refit_full(model='best', set_best_to_refit_full=True)
+        student = work.model_best
+    else:
+        students = work.distill(time_limit=time_limit, hyperparameters=hyperparameters or {'GBM': {}},
+                                teacher_preds='soft', augment_method=None)
+        leaderboard = work.leaderboard(silent=True)
+        student = leaderboard[leaderboard['model'].isin(students)].iloc[0]['model']
+
+    if os.path.exists(fast_path):
+        shutil.rmtree(fast_path)
+    work.clone_for_deployment(path=fast_path, model=student)
+    shutil.rmtree(work_path)
+    fast = TabularPredictor.load(fast_path, require_version_match=True)
+    fast.persist()
+
+    # Compare teacher and surrogate on the held out test set of the run
+    label = teacher.label
+    test_data = pd.read_csv(os.path.join(model_path, 'test_data.csv'))
+    X_test = test_data.drop(columns=[label])
+    teacher_pred, teacher_time = _timed_predict(teacher, X_test)
+    fast_pred, fast_time = _timed_predict(fast, X_test)
+    teacher_scores = teacher.evaluate_predictions(y_true=test_data[label], y_pred=teacher_pred, auxiliary_metrics=True)
+    fast_scores = fast.evaluate_predictions(y_true=test_data[label], y_pred=fast_pred, auxiliary_metrics=True)
+    agreement = fast.evaluate_predictions(y_true=teacher_pred, y_pred=fast_pred, auxiliary_metrics=True)
+
+    report = {
+        'variant': variant,
+        'teacher_path': model_path,
+        'teacher_model': teacher.model_best,
+        'surrogate_model': student,
+        'len_test': len(test_data),
+        'teacher_r2': float(teacher_scores['r2']),
+        'surrogate_r2': float(fast_scores['r2']),
+        'r2_loss': float(teacher_scores['r2'] - fast_scores['r2']),
+        'teacher_rmse': float(abs(teacher_scores['root_mean_squared_error'])),
+        'surrogate_rmse': float(abs(fast_scores['root_mean_squared_error'])),
+        'r2_vs_teacher': float(agreement['r2']),
+        'teacher_rows_per_sec': len(test_data) / teacher_time,
+        'surrogate_rows_per_sec': len(test_data) / fast_time,
+    }
+    with open(os.path.join(fast_path, 'distill_report.json'), 'w') as f:
+        json.dump(report, f, indent=4)
+    print(json.dumps(report, indent=4))
+    return report
@@ -111,42 +111,82 @@ def age_setting1():
     return  age_cols, age_names 
 
 
-import pandas as pd
 import numpy as np
 
-def optimize_preprocessing(data):
+# Rows aggregated per matmul, which bounds the float buffer to CHUNK_ROWS x input columns
+CHUNK_ROWS = 262144
+
+
+def group_settings():
+    """
+    The (column groups, names, column suffix) of every meta attribute family, in output order.
+    """
+    return [
+        type_setting1() + ('_pct',),
+        age_setting1() + ('_pct',),
+        eth_setting() + ('',),
+        econ_settings() + ('',),
+        hh_size_setting() + ('',),
+    ]
+
+
+def compile_groups(settings=None):
+    """
+    Compile the group settings into input columns, output names and a column-to-group
+    count matrix, so every meta attribute is one column of X @ matrix.
+
+    Names are paired with groups as zip(names, groups) and a repeated name keeps its
+    first position but the last group's sum, as a dict built from the pairs would.
+    """
+    settings = settings if settings is not None else group_settings()
+    groups = {}
+    for columns, names, suffix in settings:
+        for name, col_group in zip(names, columns):
+            groups[name] = [x + suffix for x in col_group]
+    input_columns = list(dict.fromkeys(col for cols in groups.values() for col in cols))
+    position = {col: i for i, col in enumerate(input_columns)}
+    matrix = np.zeros((len(input_columns), len(groups)))
+    for j, cols in enumerate(groups.values()):
+        for col in cols:
+            matrix[position[col], j] += 1
+    return input_columns, list(groups), matrix
+
+
+def optimize_preprocessing(data, chunk_rows=CHUNK_ROWS):
     """
     Convert attributes into meta attributes by combinign certain subgroups 
+
+    Missing values count as 0. The sums are computed in row chunks as one matmul over
+    the input columns, in float32 when the inputs are float32. Integer inputs give int64
+    sums, as a pandas sum would. The meta attributes are appended as one block to a new
+    frame whose base columns share memory with data rather than copying it, so write to
+    the returned frame, not to data.
     """
-    # Pre-calculate all column mappings
-    column_mappings = {
-        'type': (type_setting1(), lambda x: x + '_pct'),
-        'age': (age_setting1(), lambda x: x + '_pct'),
-        'eth': (eth_setting(), lambda x: x),
-        'econ': (econ_settings(), lambda x: x),
-        'hh_size': (hh_size_setting(), lambda x: x)
-    }
-    
-    # Vectorized operations instead of loops
-    def process_columns(columns, names, transform_fn):
-        # Create all column lists at once
-        all_cols = [[transform_fn(x) for x in col_group] for col_group in columns]
-        
-        # Perform vectorized operations
-        results = pd.DataFrame({
-            name: data[cols].fillna(0).sum(axis=1) 
-            for name, cols in zip(names, all_cols)
-        })
-        
-        return results
-    
-    # Process all categories at once
-    results = []
-    for (columns, names), transform_fn in column_mappings.values():
-        results.append(process_columns(columns, names, transform_fn))
-    
-    # Combine results efficiently
-    return pd.concat([data] + results, axis=1)
+    input_columns, names, matrix = compile_groups()
+    missing = [col for col in input_columns if col not in data.columns]
+    if missing:
+        raise KeyError(f'{missing} not in index')
+
+    arrays = [data[col].to_numpy() for col in input_columns]
+    dtype = np.result_type(np.float32, *[a.dtype for a in arrays])
+    matrix = matrix.astype(dtype)
+    out = np.empty((len(data), len(names)), dtype=dtype)
+    buffer = np.empty((min(chunk_rows, len(data)), len(input_columns)), dtype=dtype)
+    for start in range(0, len(data), chunk_rows):
+        stop = min(start + chunk_rows, len(data))
+        X = buffer[:stop - start]
+        for j, a in enumerate(arrays):
+            X[:, j] = a[start:stop]
+        np.nan_to_num(X, copy=False, nan=0.0)
+        np.matmul(X, matrix, out=out[start:stop])
+
+    if all(np.issubdtype(a.dtype, np.integer) for a in arrays):
+        # Integer sums are exact in float64 well beyond any count in the data
+        out = out.astype(np.int64)
+    # One block of new columns, so the frame is not fragmented; with copy-on-write the
+    # concat reuses the base blocks instead of consolidating them into a copy
+    with pd.option_context('mode.copy_on_write', True):
+        return pd.concat([data, pd.DataFrame(out, columns=names, index=data.index)], axis=1)
 
 # Modified function calls
 def pre_process_pc(data):
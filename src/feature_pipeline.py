@@ -0,0 +1,86 @@
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.conf import calculate_floor_area_confidence
+from src.data_loader import iter_chunks
+from src.feature_gen import optimize_preprocessing
+
+# Floor area estimates compared for confidence_floor_area
+FLOOR_AREA_COLUMNS = ('all_res_total_fl_area_H_total', 'all_res_total_fl_area_FC_total')
+
+
+def preprocess_chunk(chunk, floor_area_columns=FLOOR_AREA_COLUMNS):
+    """
+    All row-wise feature steps for one chunk: the meta attribute sums and, if
+    floor_area_columns is given, the floor area confidence.
+    """
+    chunk = optimize_preprocessing(chunk)
+    if floor_area_columns:
+        chunk = calculate_floor_area_confidence(chunk, *floor_area_columns)
+    return chunk
+
+
+def build_features(input_path, columns=None, chunksize=100000, n_workers=1, floor_area_columns=FLOOR_AREA_COLUMNS,
+                   downcast=True):
+    """
+    Generator of preprocessed chunks of a CSV or Parquet file, in input order.
+
+    Every step is row-wise, so chunks are independent: with n_workers > 1 they are
+    processed on a process pool with at most 2 * n_workers chunks in flight, which
+    keeps memory bounded by the chunk size rather than the dataset size.
+    """
+    chunks = iter_chunks(input_path, columns=columns, chunksize=chunksize, downcast=downcast)
+    if n_workers <= 1:
+        for chunk in chunks:
+            yield preprocess_chunk(chunk, floor_area_columns)
+        return
+
+    with ProcessPoolExecutor(n_workers) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(preprocess_chunk, chunk, floor_area_columns))
+            if len(pending) >= 2 * n_workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def write_features(input_path, output_file, columns=None, chunksize=100000, n_workers=1,
+                   floor_area_columns=FLOOR_AREA_COLUMNS, downcast=True):
+    """
+    Run build_features and stream the chunks into one Parquet file.
+
+    Returns:
+        int: Number of rows written.
+    """
+    start_time = time.time()
+    os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+    tmp_path = f'{output_file}.{os.getpid()}.tmp'
+    writer = None
+    n_rows = 0
+    try:
+        for chunk in build_features(input_path, columns, chunksize, n_workers, floor_area_columns, downcast):
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_path, table.schema)
+            else:
+                # A chunk with an all-missing column can infer a different type
+                table = table.cast(writer.schema)
+            writer.write_table(table)
+            n_rows += len(chunk)
+            print(f'Processed {n_rows} rows ({n_rows / (time.time() - start_time):.0f} rows/sec)')
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if writer is None:
+        print(f'No rows found in {input_path}')
+        return 0
+    os.replace(tmp_path, output_file)
+    print(f'Wrote {n_rows} rows of features to {output_file} in {time.time() - start_time:.2f} seconds')
+    return n_rows
@@ -0,0 +1,125 @@
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from autogluon.tabular import TabularPredictor
+
+from src.column_settings import settings_dict
+from src.data_loader import iter_chunks
+from src.prediction_cache import PredictionCache
+from src.column_registry import ColumnRegistry
+
+_PREDICTOR = None
+_CACHE = None
+
+
+def _init_worker(model_path, use_cache):
+    # Each worker loads the predictor once and keeps it for every batch it scores
+    global _PREDICTOR, _CACHE
+    _PREDICTOR = TabularPredictor.load(model_path, require_version_match=True)
+    _PREDICTOR.persist()
+    _CACHE = PredictionCache(model_path) if use_cache else None
+
+
+def _predict_chunk(chunk, predictor=None, cache=None):
+    predictor = predictor or _PREDICTOR
+    cache = cache or _CACHE
+    if cache is not None:
+        return cache.predict(predictor, chunk)
+    return predictor.predict(chunk).to_numpy()
+
+
+def feature_columns(col_setting, setting_dict=settings_dict, label=None, registry=None):
+    """
+    The model input columns for a column setting, in the order used for training.
+    With a registry the setting is also checked against that dataset's schema.
+    """
+    if registry is not None:
+        return [c for c in registry.resolve(col_setting, setting_dict).columns if c != label]
+    cols = [c for c in setting_dict[col_setting][1] if c != label]
+    return list(dict.fromkeys(cols))
+
+
+def _output_frame(chunk, predictions, id_columns, label):
+    out = chunk[id_columns].reset_index(drop=True)
+    out[f'{label}_pred'] = predictions
+    return out
+
+
+def predict_to_parquet(model_path, input_path, output_file, col_setting, setting_dict=settings_dict,
+                       id_columns=None, chunksize=100000, n_workers=1, use_cache=True):
+    """
+    Score a dataset with a saved TabularPredictor and write the predictions to Parquet.
+
+    The input is streamed in chunks and at most 2 * n_workers chunks are in flight, so
+    peak memory depends on the chunk size rather than on the size of the input.
+
+    Parameters:
+        model_path (str): Directory of the saved predictor.
+        input_path (str): CSV or Parquet file of postcodes to score.
+        output_file (str): Parquet file to write.
+        col_setting (int): Column setting the predictor was trained with.
+        setting_dict (dict): settings_dict or settings_col_dict_census.
+        id_columns (list): Columns copied through to the output, e.g. postcode.
+        chunksize (int): Rows per batch.
+        n_workers (int): Prediction processes; 1 predicts in this process.
+        use_cache (bool): Reuse predictions of chunks scored before with the same model.
+
+    Returns:
+        int: Number of rows scored.
+    """
+    start_time = time.time()
+    id_columns = list(id_columns or [])
+    predictor = TabularPredictor.load(model_path, require_version_match=True)
+    label = predictor.label
+    # Fail before any prediction if the input lacks a column the model was trained on
+    registry = ColumnRegistry.from_parquet(input_path) if input_path.endswith('.parquet') else None
+    features = feature_columns(col_setting, setting_dict, label, registry)
+    chunks = iter_chunks(input_path, columns=id_columns + features, chunksize=chunksize)
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+    tmp_path = f'{output_file}.{os.getpid()}.tmp'
+    writer = None
+    n_rows = 0
+
+    def write(chunk, predictions):
+        nonlocal writer, n_rows
+        table = pa.Table.from_pandas(_output_frame(chunk, predictions, id_columns, label), preserve_index=False)
+        if writer is None:
+            writer = pq.ParquetWriter(tmp_path, table.schema)
+        writer.write_table(table)
+        n_rows += len(chunk)
+        print(f'Scored {n_rows} rows ({n_rows / (time.time() - start_time):.0f} rows/sec)')
+
+    try:
+        if n_workers <= 1:
+            predictor.persist()
+            cache = PredictionCache(model_path) if use_cache else None
+            for chunk in chunks:
+                write(chunk, _predict_chunk(chunk[features], predictor, cache))
+        else:
+            del predictor
+            with ProcessPoolExecutor(n_workers, initializer=_init_worker, initargs=(model_path, use_cache)) as pool:
+                # Keep the output in input order while bounding the number of queued chunks
+                pending = deque()
+                for chunk in chunks:
+                    pending.append((chunk[id_columns], pool.submit(_predict_chunk, chunk[features])))
+                    if len(pending) >= 2 * n_workers:
+                        ids, future = pending.popleft()
+                        write(ids, future.result())
+                while pending:
+                    ids, future = pending.popleft()
+                    write(ids, future.result())
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if writer is None:
+        print(f'No rows found in {input_path}')
+        return 0
+    os.replace(tmp_path, output_file)
+    print(f'Wrote {n_rows} predictions to {output_file} in {time.time() - start_time:.2f} seconds')
+    return n_rows
@@ -0,0 +1,149 @@
+import os
+import json
+import fcntl
+import hashlib
+from datetime import datetime
+
+# Stage DAG for one run: each stage lists the stages whose outputs it consumes.
+# Parametrised stages such as 'sobol:SE:model_results:N65536:ungrouped' use the part before the first ':'.
+STAGES = {
+    'fit': [],
+    'predict': ['fit'],
+    'leaderboard': ['predict'],
+    'feature_importance': ['predict'],
+    'sobol': ['fit'],
+    'extraction': ['predict'],
+}
+
+MANIFEST_DIR = '.manifest'
+
+
+def job_key(config, data_fingerprint):
+    """
+    Content-addressed key for a run: a hash of its config and the data fingerprint.
+    """
+    payload = json.dumps({'config': config, 'data': data_fingerprint}, sort_keys=True, default=str)
+    return hashlib.blake2b(payload.encode(), digest_size=8).hexdigest()
+
+
+def _atomic_write_json(path, record):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(record, f, indent=4, default=str)
+    os.replace(tmp_path, path)
+
+
+class RunManifest:
+    """
+    Per-run record of which stages have completed, stored as
+    <results folder>/.manifest/<key>.json. A stage is stale if it never finished,
+    any of its outputs are missing, or an upstream stage has re-run since.
+    """
+
+    def __init__(self, results_folder, key, record):
+        self.path = os.path.join(results_folder, MANIFEST_DIR, f'{key}.json')
+        self.key = key
+        self.record = record
+
+    @classmethod
+    def load(cls, results_folder, config, data_fingerprint, output_directory, run_info=None):
+        """
+        Load the manifest for a run, or start a new one. run_info holds the
+        descriptive fields (label, loc_type, region, ...) that extraction reports.
+        """
+        key = job_key(config, data_fingerprint)
+        path = os.path.join(results_folder, MANIFEST_DIR, f'{key}.json')
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                record = json.load(f)
+        else:
+            record = {
+                'key': key,
+                'config': config,
+                'data_fingerprint': data_fingerprint,
+                'output_directory': output_directory,
+                'run': run_info or {},
+                'stages': {},
+            }
+        return cls(results_folder, key, record)
+
+    @staticmethod
+    def from_file(path):
+        with open(path, 'r') as f:
+            record = json.load(f)
+        return RunManifest(os.path.dirname(os.path.dirname(path)), record['key'], record)
+
+    @property
+    def config(self):
+        return self.record['config']
+
+    @property
+    def run_info(self):
+        return self.record.get('run', {})
+
+    @property
+    def output_directory(self):
+        return self.record['output_directory']
+
+    def _deps(self, stage):
+        return STAGES[stage.split(':')[0]]
+
+    def is_fresh(self, stage):
+        entry = self.record['stages'].get(stage)
+        if entry is None or entry['status'] != 'done':
+            return False
+        if not all(os.path.exists(os.path.join(self.output_directory, out)) for out in entry['outputs']):
+            return False
+        for dep in self._deps(stage):
+            if not self.is_fresh(dep):
+                return False
+            if entry['upstream'].get(dep) != self.record['stages'][dep]['finished_at']:
+                return False
+        return True
+
+    def stale_stages(self, stages):
+        return [stage for stage in stages if not self.is_fresh(stage)]
+
+    def mark_done(self, stage, outputs=()):
+        """
+        Record a completed stage and the outputs (relative to the run directory) it wrote.
+        """
+        entry = {
+            'status': 'done',
+            'finished_at': datetime.now().isoformat(),
+            'outputs': list(outputs),
+            'upstream': {dep: self.record['stages'][dep]['finished_at'] for dep in self._deps(stage)},
+        }
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # Several processes (e.g. Sobol regions) may record stages of the same run at once,
+        # so merge with the file on disk under a lock rather than overwriting it
+        with open(f'{self.path}.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if os.path.exists(self.path):
+                with open(self.path, 'r') as f:
+                    self.record['stages'] = dict(json.load(f)['stages'], **self.record['stages'])
+            self.record['stages'][stage] = entry
+            _atomic_write_json(self.path, self.record)
+
+
+def load_manifests(results_folder):
+    """
+    Return every run manifest in a results folder, keyed by run directory name.
+    """
+    manifest_dir = os.path.join(results_folder, MANIFEST_DIR)
+    if not os.path.isdir(manifest_dir):
+        return {}
+    paths = [os.path.join(manifest_dir, f) for f in os.listdir(manifest_dir) if f.endswith('.json')]
+    manifests = {}
+    # Oldest first, so a directory re-run on new data maps to its latest manifest
+    for path in sorted(paths, key=os.path.getmtime):
+        manifest = RunManifest.from_file(path)
+        manifests[os.path.basename(manifest.output_directory)] = manifest
+    return manifests
+
+
+def find_manifest(output_directory):
+    """
+    Return the manifest for a run directory, or None for runs made before manifests existed.
+    """
+    return load_manifests(os.path.dirname(output_directory)).get(os.path.basename(output_directory))
@@ -0,0 +1,117 @@
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+
+# Predictions are memoised per model under the results tree, shared by Sobol and batch scoring
+CACHE_DIR = os.environ.get('PREDICTION_CACHE_DIR', './results/prediction_cache')
+MAX_CACHE_GB = float(os.environ.get('PREDICTION_CACHE_GB', 20))
+
+
+def model_fingerprint(model_path):
+    """
+    Hash of a saved predictor's metadata files. Refitting into the same directory
+    rewrites them, so cached predictions of an older model are never reused.
+    """
+    h = hashlib.blake2b(digest_size=8)
+    h.update(os.path.abspath(model_path).encode())
+    for fname in ['predictor.pkl', 'learner.pkl', os.path.join('models', 'trainer.pkl')]:
+        path = os.path.join(model_path, fname)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                h.update(f.read())
+    return h.hexdigest()
+
+
+def block_key(df):
+    """
+    Hash of the column names, dtypes and values of an input block.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str([(c, str(t)) for c, t in df.dtypes.items()]).encode())
+    h.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+class PredictionCache:
+    """
+    Size-bounded on-disk cache of prediction blocks, keyed by model fingerprint and
+    a hash of the input block. Least recently used blocks (by file mtime, which is
+    refreshed on every hit) are evicted once the whole cache exceeds max_gb.
+    """
+
+    def __init__(self, model_path, cache_dir=CACHE_DIR, max_gb=MAX_CACHE_GB):
+        self.cache_dir = cache_dir
+        self.model_dir = os.path.join(cache_dir, model_fingerprint(model_path))
+        self.max_bytes = int(max_gb * 1e9)
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.model_dir, exist_ok=True)
+        self._size = self._scan_size()
+
+    def _path(self, key):
+        return os.path.join(self.model_dir, f'{key}.npy')
+
+    def _scan_size(self):
+        total = 0
+        for root, _, files in os.walk(self.cache_dir):
+            for fname in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, fname))
+                except FileNotFoundError:
+                    pass
+        return total
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            predictions = np.load(path)
+            os.utime(path)
+        except (FileNotFoundError, ValueError, OSError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return predictions
+
+    def put(self, key, predictions):
+        path = self._path(key)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, np.asarray(predictions))
+        os.replace(tmp_path, path)
+        self._size += os.path.getsize(path)
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        # Several processes share the cache, so re-read sizes from disk before deleting
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for fname in files:
+                path = os.path.join(root, fname)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= 0.9 * self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._size = total
+
+    def predict(self, predictor, df):
+        """
+        Return predictor.predict(df) as an array, from the cache when this block was seen before.
+        """
+        key = block_key(df)
+        predictions = self.get(key)
+        if predictions is None:
+            predictions = predictor.predict(df).to_numpy()
+            self.put(key, predictions)
+        return predictions
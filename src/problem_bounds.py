@@ -0,0 +1,130 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from src.data_loader import build_cache, data_fingerprint, iter_chunks
+from src.splits import global_split, RANDOM_STATE
+
+MODES = ['bounds', 'marginal']
+ALL_REGIONS = 'all'
+
+
+def region_reservoirs(data_path, names, size=100000, train_only=True, chunksize=200000, seed=RANDOM_STATE):
+    """
+    Uniform random sample of at most size rows per region, drawn in one streaming pass.
+
+    Every row gets a random key and each region keeps the rows with the smallest keys,
+    which is a uniform sample without replacement whatever the chunk order.
+    With train_only, rows of the global test split are skipped.
+
+    Returns:
+        dict: region -> DataFrame of names, with an 'all' entry for the whole dataset.
+    """
+    cache_path = build_cache(data_path)
+    train_mask = None
+    if train_only:
+        n_rows = pq.ParquetFile(cache_path).metadata.num_rows
+        train_idx, _ = global_split(n_rows, data_fingerprint(data_path))
+        train_mask = np.zeros(n_rows, dtype=bool)
+        train_mask[train_idx] = True
+
+    rng = np.random.default_rng(seed)
+    reservoirs = {}
+    offset = 0
+    for chunk in iter_chunks(cache_path, columns=list(names) + ['region'], chunksize=chunksize):
+        n_chunk = len(chunk)
+        chunk = chunk.assign(_key=rng.random(n_chunk))
+        if train_mask is not None:
+            chunk = chunk[train_mask[offset:offset + n_chunk]]
+        offset += n_chunk
+        groups = [(ALL_REGIONS, chunk)] + [(str(r), g) for r, g in chunk.groupby('region', observed=True)]
+        for region_id, group in groups:
+            kept = pd.concat([reservoirs[region_id], group]) if region_id in reservoirs else group
+            if len(kept) > size:
+                kept = kept.iloc[np.argpartition(kept['_key'].to_numpy(), size)[:size]]
+            reservoirs[region_id] = kept
+    return {region_id: sample[list(names)].reset_index(drop=True) for region_id, sample in reservoirs.items()}
+
+
+def derive_problem(sample, base_problem, mode='bounds', lower_q=0.01, upper_q=0.99, n_quantiles=101):
+    """
+    Problem definition restricted to the support of the data in sample.
+
+    'bounds' replaces each bound with the [lower_q, upper_q] quantiles of the data.
+    'marginal' samples on [0, 1] and adds a 'ppf_grid' of n_quantiles quantiles per
+    variable between lower_q and upper_q, which to_model_inputs uses to map the unit
+    sample onto the empirical marginal distribution.
+    Variables without data keep their bounds from base_problem.
+    """
+    if mode not in MODES:
+        raise ValueError(f'Unknown problem mode {mode}')
+    problem = {k: v for k, v in base_problem.items() if k not in ('bounds', 'ppf_grid')}
+    levels = np.linspace(lower_q, upper_q, n_quantiles)
+    bounds, grids = [], []
+    for name, base_bounds in zip(base_problem['names'], base_problem['bounds']):
+        values = sample[name].to_numpy(dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            grid = np.linspace(base_bounds[0], base_bounds[1], n_quantiles)
+        else:
+            grid = np.quantile(values, levels)
+        lower, upper = float(grid[0]), float(grid[-1])
+        if upper <= lower:
+            # SALib needs a non-empty interval
+            upper = lower + max(abs(lower) * 1e-6, 1e-6)
+        bounds.append([lower, upper])
+        grids.append([float(v) for v in grid])
+
+    if mode == 'bounds':
+        problem['bounds'] = bounds
+    else:
+        problem['bounds'] = [[0.0, 1.0] for _ in bounds]
+        problem['ppf_grid'] = grids
+    problem['num_vars'] = len(problem['names'])
+    return problem
+
+
+def to_model_inputs(X, problem):
+    """
+    Map a sample drawn for problem onto model inputs. Only problems with a
+    'ppf_grid' need this; others are returned unchanged.
+    """
+    if 'ppf_grid' not in problem:
+        return X
+    X = np.array(X, dtype=np.float64)
+    for j, grid in enumerate(problem['ppf_grid']):
+        levels = np.linspace(0, 1, len(grid))
+        X[:, j] = np.interp(X[:, j], levels, grid)
+    return X
+
+
+def get_problem_path(problem_dir, region_id):
+    return os.path.join(problem_dir, f'{region_id}.json')
+
+
+def load_problem(problem_dir, region_id):
+    with open(get_problem_path(problem_dir, region_id), 'r') as f:
+        return json.load(f)
+
+
+def write_region_problems(data_path, problem_dir, base_problem, mode='bounds', lower_q=0.01, upper_q=0.99,
+                          size=100000, train_only=True):
+    """
+    Derive a problem definition per region (and one for all regions) and write them
+    to <problem_dir>/<region>.json.
+
+    Returns:
+        dict: region -> problem definition.
+    """
+    samples = region_reservoirs(data_path, base_problem['names'], size=size, train_only=train_only)
+    os.makedirs(problem_dir, exist_ok=True)
+    problems = {}
+    for region_id, sample in samples.items():
+        problem = derive_problem(sample, base_problem, mode, lower_q, upper_q)
+        with open(get_problem_path(problem_dir, region_id), 'w') as f:
+            json.dump(problem, f, indent=4)
+        problems[region_id] = problem
+        print(f'{region_id}: problem derived from {len(sample)} rows')
+    return problems
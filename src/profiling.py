@@ -0,0 +1,125 @@
+import os
+import sys
+import json
+import time
+import cProfile
+import resource
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+# off: spans only feed the run summaries, on: also write trace.json,
+# cprofile / tracemalloc: on plus a profile or Python allocation peak per span
+PROFILE = os.environ.get('PROFILE', 'off')
+PROFILE_MODES = ['off', 'on', 'cprofile', 'tracemalloc']
+TRACE_FILE = 'trace.json'
+ROLLUP_FILE = 'profile_rollup.csv'
+
+
+def _peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def package_versions():
+    versions = {'python': sys.version.split()[0], 'pandas': pd.__version__}
+    for module in ['autogluon.tabular', 'numpy', 'SALib']:
+        package = sys.modules.get(module)
+        if package is not None:
+            versions[module] = getattr(package, '__version__', None)
+    return versions
+
+
+class Tracer:
+    """
+    Records a wall-clock span per stage. Spans are always timed, which is cheap;
+    the trace file and the cProfile/tracemalloc captures are only produced when
+    profiling is switched on with the PROFILE environment variable.
+    """
+
+    def __init__(self, name, mode=PROFILE):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f'Unknown profile mode {mode}')
+        self.name = name
+        self.mode = mode
+        self.spans = []
+        self._profiles = {}
+        self._depth = 0
+
+    @property
+    def enabled(self):
+        return self.mode != 'off'
+
+    @contextmanager
+    def span(self, name):
+        record = {'name': name, 'depth': self._depth}
+        profile = None
+        # Profilers are not nested, so only top level spans get their own capture
+        if self.mode == 'cprofile' and self._depth == 0:
+            profile = self._profiles.setdefault(name, cProfile.Profile())
+            profile.enable()
+        elif self.mode == 'tracemalloc' and self._depth == 0:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        self._depth += 1
+        start = time.time()
+        try:
+            yield record
+        finally:
+            record['seconds'] = time.time() - start
+            self._depth -= 1
+            if profile is not None:
+                profile.disable()
+            if self.mode == 'tracemalloc':
+                record['tracemalloc_peak_mb'] = tracemalloc.get_traced_memory()[1] / 1e6
+            record['peak_rss_mb'] = _peak_rss_mb()
+            self.spans.append(record)
+
+    def durations(self):
+        """
+        Seconds per span name, summed over repeated spans.
+        """
+        durations = {}
+        for record in self.spans:
+            durations[record['name']] = durations.get(record['name'], 0.0) + record['seconds']
+        return durations
+
+    def save(self, output_path, file_name=TRACE_FILE):
+        """
+        Write the spans (and any cProfile stats) to output_path. Does nothing when profiling is off.
+        """
+        if not self.enabled:
+            return None
+        os.makedirs(output_path, exist_ok=True)
+        for name, profile in self._profiles.items():
+            profile.dump_stats(os.path.join(output_path, f'profile_{name.replace("/", "_")}.prof'))
+        trace = {'name': self.name, 'mode': self.mode, 'pid': os.getpid(), 'saved_at': time.time(),
+                 'versions': package_versions(), 'peak_rss_mb': _peak_rss_mb(), 'spans': self.spans}
+        path = os.path.join(output_path, file_name)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(trace, f, indent=4)
+        os.replace(tmp_path, path)
+        return path
+
+
+def rollup_traces(base_dir, file_name=TRACE_FILE, output_file=ROLLUP_FILE):
+    """
+    Collect every trace file under base_dir into one table with a row per span,
+    written to <base_dir>/<output_file>. Returns the table (empty if there are no traces).
+    """
+    rows = []
+    for root, _, files in os.walk(base_dir):
+        if file_name not in files:
+            continue
+        with open(os.path.join(root, file_name), 'r') as f:
+            trace = json.load(f)
+        for record in trace['spans']:
+            rows.append({'run': os.path.relpath(root, base_dir), 'trace': trace['name'], 'mode': trace['mode'],
+                         'autogluon': trace['versions'].get('autogluon.tabular'), **record})
+    rollup = pd.DataFrame(rows)
+    if not rollup.empty:
+        rollup.to_csv(os.path.join(base_dir, output_file), index=False)
+        print(f'Rolled up {len(rollup)} spans from {rollup["run"].nunique()} traces into {os.path.join(base_dir, output_file)}')
+    return rollup
@@ -0,0 +1,224 @@
+import os
+import ast
+import json
+import time
+import sqlite3
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from src.manifest import load_manifests, MANIFEST_DIR
+
+# One SQLite file holds the results of every sweep, keyed by results folder and run folder
+STORE_PATH = os.environ.get('RESULTS_STORE', './results/results_store.sqlite')
+RUN_FILES = ['model_summary.json', 'model_summary.txt', 'leaderboard_results.csv', 'feature_importance.csv']
+
+
+def run_signature(run_path):
+    """
+    Size and mtime of the result files of a run; a run is re-ingested when this changes.
+    """
+    parts = []
+    for fname in RUN_FILES:
+        path = os.path.join(run_path, fname)
+        if os.path.exists(path):
+            stat = os.stat(path)
+            parts.append(f'{fname}:{stat.st_size}:{stat.st_mtime_ns}')
+    return '|'.join(parts)
+
+
+def run_fields(subdir, manifest=None):
+    """
+    Config fields of a run, from its manifest or, for runs made before manifests
+    existed, from the run folder name. Returns None if neither has them.
+    """
+    if manifest is not None and manifest.run_info:
+        run_info = manifest.run_info
+        return {
+            'col_setting': str(run_info['col_setting']),
+            'train_subset': str(run_info['train_subset_prop']),
+            'model_types': run_info['model_types'],
+            'time_Limit': str(run_info['time_limit']),
+            'model_qual': run_info['model_preset'],
+            'label': run_info['label'],
+            'loc_type': run_info['loc_type'],
+            'dname': run_info['dataset_name'],
+            'region': run_info['region'],
+        }
+    subdir_parts = subdir.split('__')
+    if len(subdir_parts) < 5:
+        return None
+    return {
+        'col_setting': subdir_parts[4].split('_')[-1],
+        'train_subset': subdir_parts[6].split('_')[-1],
+        'model_types': subdir_parts[7],
+        'time_Limit': subdir_parts[3],
+        'model_qual': subdir_parts[5],
+        'label': subdir_parts[2],
+        'loc_type': subdir_parts[1],
+        'dname': subdir_parts[0],
+        'region': subdir_parts[8] if len(subdir_parts) > 8 else 'None',
+    }
+
+
+def _performance(record):
+    performance = {f'time_{stage}': seconds for stage, seconds in record.get('timings', {}).items()}
+    for key in ['run_key', 'data_fingerprint', 'peak_rss_mb', 'peak_rss_children_mb']:
+        if key in record:
+            performance[key] = record[key]
+    return pd.DataFrame([performance])
+
+
+def read_run(run_path):
+    """
+    Parse the result files of one run folder. Missing files give None.
+    model_summary.json is preferred; older runs only have model_summary.txt.
+    """
+    summary, performance = None, None
+    json_path = os.path.join(run_path, 'model_summary.json')
+    summary_path = os.path.join(run_path, 'model_summary.txt')
+    if os.path.exists(json_path):
+        with open(json_path, 'r') as f:
+            record = json.load(f)
+        performance = _performance(record)
+        if 'metrics' in record:
+            summary = {**record['metrics'], 'len_train': record['len_train'], 'len_test': record['len_test']}
+    if summary is None and os.path.exists(summary_path):
+        with open(summary_path, 'r') as f:
+            summary = ast.literal_eval(f.read())
+    if summary is None:
+        return None
+
+    leaderboard = None
+    leaderboard_path = os.path.join(run_path, 'leaderboard_results.csv')
+    if os.path.exists(leaderboard_path):
+        leaderboard = pd.read_csv(leaderboard_path, index_col=0)
+
+    importance = None
+    importance_path = os.path.join(run_path, 'feature_importance.csv')
+    if os.path.exists(importance_path):
+        importance = pd.read_csv(importance_path, index_col=0).rename_axis('feature').reset_index()
+    return summary, leaderboard, importance, performance
+
+
+class ResultsStore:
+    """
+    Consolidated store of run summaries, leaderboards and feature importances.
+    Each ingest only parses run folders that are new or whose result files changed.
+    """
+
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS runs (folder TEXT, run TEXT, signature TEXT, fields TEXT, '
+                         'summary TEXT, ingested_at REAL, PRIMARY KEY (folder, run))')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=60)
+
+    def _append(self, conn, table, df):
+        # AutoGluon versions differ in leaderboard columns, so add any the table lacks
+        existing = [row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')]
+        if existing:
+            for column in df.columns:
+                if column not in existing:
+                    conn.execute(f'ALTER TABLE "{table}" ADD COLUMN "{column}"')
+        df.to_sql(table, conn, if_exists='append', index=False)
+
+    def _table_exists(self, conn, table):
+        return conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone() is not None
+
+    def signatures(self, folder):
+        with closing(self._connect()) as conn:
+            return dict(conn.execute('SELECT run, signature FROM runs WHERE folder=?', (folder,)).fetchall())
+
+    def ingest(self, base_dir, n_workers=8):
+        """
+        Bring the store up to date with the run folders in base_dir. Folders are read on
+        a thread pool; runs whose folder was removed are dropped from the store.
+
+        Returns:
+            list: Names of the run folders that were (re)ingested.
+        """
+        start_time = time.time()
+        folder = os.path.basename(os.path.normpath(base_dir))
+        manifests = load_manifests(base_dir)
+        known = self.signatures(folder)
+
+        candidates = {}
+        for subdir in sorted(os.listdir(base_dir)):
+            run_path = os.path.join(base_dir, subdir)
+            if not os.path.isdir(run_path) or subdir == MANIFEST_DIR:
+                continue
+            fields = run_fields(subdir, manifests.get(subdir))
+            if fields is None:
+                print(f"Skipping directory: {subdir}. Insufficient parts found.")
+                continue
+            candidates[subdir] = fields
+        changed = {subdir: run_signature(os.path.join(base_dir, subdir)) for subdir in candidates}
+        changed = {subdir: sig for subdir, sig in changed.items() if known.get(subdir) != sig}
+
+        with ThreadPoolExecutor(n_workers) as pool:
+            parsed = dict(zip(changed, pool.map(read_run, [os.path.join(base_dir, s) for s in changed])))
+
+        ingested = []
+        with closing(self._connect()) as conn, conn:
+            removed = [run for run in known if run not in candidates]
+            for run in removed + list(changed):
+                self._delete_run(conn, folder, run)
+            for subdir, result in parsed.items():
+                if result is None:
+                    print(f"Skipping directory: {subdir}. No model summary found.")
+                    continue
+                summary, leaderboard, importance, performance = result
+                conn.execute('INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?)',
+                             (folder, subdir, changed[subdir], json.dumps(candidates[subdir]),
+                              json.dumps(summary, default=float), time.time()))
+                if leaderboard is not None:
+                    self._append(conn, 'leaderboards', leaderboard.assign(folder=folder, run=subdir))
+                if importance is not None:
+                    self._append(conn, 'feature_importance', importance.assign(folder=folder, run=subdir))
+                if performance is not None:
+                    self._append(conn, 'performance', performance.assign(folder=folder, run=subdir))
+                ingested.append(subdir)
+        print(f'Ingested {len(ingested)} new or changed runs of {len(candidates)} in {base_dir} '
+              f'({len(removed)} removed) in {time.time() - start_time:.2f} seconds')
+        return ingested
+
+    def _delete_run(self, conn, folder, run):
+        conn.execute('DELETE FROM runs WHERE folder=? AND run=?', (folder, run))
+        for table in ['leaderboards', 'feature_importance', 'performance']:
+            if self._table_exists(conn, table):
+                conn.execute(f'DELETE FROM "{table}" WHERE folder=? AND run=?', (folder, run))
+
+    def results(self, folder):
+        """
+        One row per run: the metrics of model_summary.txt followed by the run config fields.
+        """
+        with closing(self._connect()) as conn:
+            rows = conn.execute('SELECT fields, summary FROM runs WHERE folder=? ORDER BY run', (folder,)).fetchall()
+        records = [{**json.loads(summary), **json.loads(fields)} for fields, summary in rows]
+        return pd.DataFrame.from_records(records)
+
+    def _read_table(self, table, folder=None):
+        with closing(self._connect()) as conn:
+            if not self._table_exists(conn, table):
+                return pd.DataFrame()
+            if folder is None:
+                return pd.read_sql(f'SELECT * FROM "{table}"', conn)
+            return pd.read_sql(f'SELECT * FROM "{table}" WHERE folder=?', conn, params=(folder,))
+
+    def leaderboards(self, folder=None):
+        return self._read_table('leaderboards', folder)
+
+    def feature_importance(self, folder=None):
+        return self._read_table('feature_importance', folder)
+
+    def performance(self, folder=None):
+        """
+        Stage timings (time_<stage> in seconds) and peak memory of each run.
+        """
+        return self._read_table('performance', folder)
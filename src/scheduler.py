@@ -0,0 +1,98 @@
+import os
+import time
+import traceback
+import multiprocessing as mp
+
+# Set in the parent before the pool forks so every worker shares them copy-on-write
+_JOB_FN = None
+_SHARED_DATA = None
+
+
+def total_memory_gb():
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / 1e9
+
+
+def data_size_gb(data):
+    if data is None:
+        return 0.0
+    return data.memory_usage(deep=True).sum() / 1e9
+
+
+def plan_workers(n_jobs, data_gb=0.0, cpu_budget=None, mem_budget_gb=None, cpus_per_job=None, mem_per_job_gb=None):
+    """
+    Size the worker pool from core and memory budgets.
+
+    Parameters:
+        n_jobs (int): Number of jobs to schedule.
+        data_gb (float): Size of the shared dataset, used for the default per-job memory estimate.
+        cpu_budget (int): Cores the sweep may use (default: all cores).
+        mem_budget_gb (float): Memory the sweep may use (default: 80% of physical memory).
+        cpus_per_job (int): Cores given to each job (default: budget split over the concurrent jobs).
+        mem_per_job_gb (float): Memory reserved per job (default: a rough multiple of the data size).
+
+    Returns:
+        tuple: (number of workers, cpus per job)
+    """
+    cpu_budget = cpu_budget or os.cpu_count()
+    mem_budget_gb = mem_budget_gb or 0.8 * total_memory_gb()
+    # AutoGluon holds several copies of the training frame while fitting
+    mem_per_job_gb = mem_per_job_gb or max(4.0, 10 * data_gb)
+
+    mem_slots = max(1, int(mem_budget_gb // mem_per_job_gb))
+    if cpus_per_job is None:
+        cpus_per_job = max(1, cpu_budget // min(n_jobs, mem_slots))
+    cpu_slots = max(1, cpu_budget // cpus_per_job)
+    n_workers = max(1, min(n_jobs, cpu_slots, mem_slots))
+    return n_workers, cpus_per_job
+
+
+def _run_job(task):
+    index, config, num_cpus = task
+    start_time = time.time()
+    try:
+        _JOB_FN(config, _SHARED_DATA, num_cpus)
+        return index, 'done', time.time() - start_time, None
+    except Exception:
+        return index, 'failed', time.time() - start_time, traceback.format_exc()
+
+
+def run_jobs(job_fn, configs, shared_data=None):
+    """
+    Run job_fn(config, shared_data, num_cpus) for every config on a forked process pool.
+
+    The shared data is loaded once by the caller and inherited by the workers. Each
+    worker runs a single job so memory is returned to the system between jobs.
+    Budgets are read from CPU_BUDGET, MEM_BUDGET_GB, CPUS_PER_JOB and MEM_PER_JOB_GB.
+
+    Returns:
+        dict: Status, elapsed seconds and any traceback, keyed by the config index.
+    """
+    global _JOB_FN, _SHARED_DATA
+
+    def env_number(key, cast):
+        value = os.environ.get(key)
+        return cast(value) if value else None
+
+    n_workers, cpus_per_job = plan_workers(
+        len(configs),
+        data_gb=data_size_gb(shared_data),
+        cpu_budget=env_number('CPU_BUDGET', int),
+        mem_budget_gb=env_number('MEM_BUDGET_GB', float),
+        cpus_per_job=env_number('CPUS_PER_JOB', int),
+        mem_per_job_gb=env_number('MEM_PER_JOB_GB', float),
+    )
+    print(f'Scheduling {len(configs)} jobs on {n_workers} workers with {cpus_per_job} cpus each')
+
+    _JOB_FN, _SHARED_DATA = job_fn, shared_data
+    tasks = [(i, config, cpus_per_job) for i, config in enumerate(configs)]
+    results = {}
+    try:
+        with mp.get_context('fork').Pool(n_workers, maxtasksperchild=1) as pool:
+            for index, status, elapsed, error in pool.imap_unordered(_run_job, tasks):
+                results[index] = {'status': status, 'elapsed': elapsed, 'error': error}
+                print(f'Job {index + 1}/{len(configs)} {status} in {elapsed:.2f} seconds')
+                if error:
+                    print(error)
+    finally:
+        _JOB_FN, _SHARED_DATA = None, None
+    return results
@@ -1,42 +1,327 @@
 import os
 import json
 import time
+import hashlib
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from types import MethodType
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
+from scipy.stats import norm
 from SALib.sample import saltelli
 
 from SALib.analyze import sobol
+from SALib.util import ResultDict
 import seaborn as sns 
 
+from src.problem_bounds import to_model_inputs
+from src.profiling import Tracer
 
 
 
+
+# Saltelli sample matrices are shared by every region and rerun with the same settings
+SAMPLE_CACHE_DIR = os.environ.get('SOBOL_SAMPLE_DIR', './results/sobol_samples')
+# Rows per predict call when evaluating the Saltelli sample
+BATCH_SIZE = int(os.environ.get('SOBOL_BATCH_SIZE', 65536))
+# 'batched' computes the indices and bootstrap intervals with array operations, 'salib' uses sobol.analyze
+ESTIMATOR = os.environ.get('SOBOL_ESTIMATOR', 'batched')
+# Memory for one chunk of bootstrap resamples, and processes sharing the resamples
+BOOTSTRAP_CHUNK_MB = int(os.environ.get('SOBOL_BOOTSTRAP_MB', 512))
+BOOTSTRAP_WORKERS = int(os.environ.get('SOBOL_BOOTSTRAP_WORKERS', 1))
+
+_BOOTSTRAP_DATA = None
+
+
 def remove_groups_from_problem(problem):
     return {k: v for k, v in problem.items() if k != 'groups'}
 
-def model_function(X, predictor, region_id, problem):
-    df = pd.DataFrame(X, columns=problem['names'])
-    df['region'] = [region_id for _ in range(len(df))]
+def problem_hash(problem):
+    # The sample only depends on the design, not on how it is mapped to model inputs
+    payload = json.dumps({k: v for k, v in problem.items() if k != 'ppf_grid'}, sort_keys=True, default=str)
+    return hashlib.blake2b(payload.encode(), digest_size=8).hexdigest()
+
+def get_saltelli_sample(problem, N, calc_second_order=True, skip_values=None, cache_dir=SAMPLE_CACHE_DIR):
+    """
+    Saltelli sample for (problem, N, design), generated once and stored as a float32
+    .npy file. Returned memory-mapped so concurrent regions share one copy.
+    The Sobol sequence is deterministic, so no seed is involved.
+    """
+    design = 'so' if calc_second_order else 'fo'
+    skip = '' if skip_values is None else f'_skip{skip_values}'
+    path = os.path.join(cache_dir, f'saltelli_{problem_hash(problem)}_N{N}_{design}{skip}.npy')
+    if not os.path.exists(path):
+        param_values = saltelli.sample(problem, N, calc_second_order=calc_second_order, skip_values=skip_values)
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, param_values.astype(np.float32))
+        os.replace(tmp_path, path)
+    return np.load(path, mmap_mode='r')
+
+def _predict_block(X, predictor, region_id, problem, cache=None):
+    df = pd.DataFrame(to_model_inputs(X, problem), columns=problem['names'])
+    df['region'] = region_id
+    if cache is not None:
+        return cache.predict(predictor, df)
+    return predictor.predict(df).to_numpy()
+
+def _evaluate_chunk(X, Y, start, stop, predictor, region_id, problem, max_retries, min_chunk_size, cache=None):
+    """
+    Predict rows start:stop into Y. A failing chunk is retried, then split in half until
+    the failure is confined to blocks of at most min_chunk_size rows, which are left as NaN.
+    Returns the number of rows that could not be predicted.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            Y[start:stop] = _predict_block(X[start:stop], predictor, region_id, problem, cache)
+            return 0
+        except Exception as e:
+            print(f"Error in model prediction for rows {start}-{stop} (attempt {attempt + 1}): {e}")
+    if stop - start <= min_chunk_size:
+        return stop - start
+    mid = (start + stop) // 2
+    return (_evaluate_chunk(X, Y, start, mid, predictor, region_id, problem, 0, min_chunk_size, cache)
+            + _evaluate_chunk(X, Y, mid, stop, predictor, region_id, problem, 0, min_chunk_size, cache))
+
+def model_function(X, predictor, region_id, problem, batch_size=BATCH_SIZE, max_retries=1, min_chunk_size=256, cache=None):
+    """
+    Evaluate the predictor on the sample matrix chunk by chunk into a preallocated
+    output, so peak memory depends on batch_size rather than on N. Rows in chunks
+    that keep failing are returned as NaN without discarding the rest. With a
+    PredictionCache, chunks evaluated before are read back instead of predicted.
+    """
+    Y = np.full(len(X), np.nan)
+    start_time = time.time()
+    n_failed = 0
+    for start in range(0, len(X), batch_size):
+        stop = min(start + batch_size, len(X))
+        n_failed += _evaluate_chunk(X, Y, start, stop, predictor, region_id, problem, max_retries, min_chunk_size, cache)
+    elapsed = time.time() - start_time
+    print(f"Predicted {len(X) - n_failed} of {len(X)} rows for region {region_id} in {elapsed:.2f} seconds "
+          f"({len(X) / max(elapsed, 1e-9):.0f} rows/sec)")
+    if cache is not None:
+        print(f"Prediction cache: {cache.hits} hits, {cache.misses} misses")
+    bad = ~np.isfinite(Y)
+    if np.any(bad) and n_failed < bad.sum():
+        print(f"Warning: NaN or Inf in predictions for inputs: {pd.DataFrame(X[bad][:5], columns=problem['names'])}")
+    return Y
+
+def _separate_output_values(Y, D, calc_second_order):
+    # Rows of each base sample are A, AB_1..AB_D, [BA_1..BA_D,] B
+    step = 2 * D + 2 if calc_second_order else D + 2
+    Y = Y.reshape(-1, step)
+    BA = Y[:, D + 1:2 * D + 1] if calc_second_order else None
+    return Y[:, 0], Y[:, -1], Y[:, 1:D + 1], BA
+
+def _sobol_estimates(A, B, AB, BA):
+    """
+    First, total and second order estimates for a stack of resamples. A and B are
+    (N, R), AB and BA are (N, R, D); returns arrays of shape (R, D), (R, D) and (R, D, D).
+    Same estimators as SALib: Saltelli et al. 2010 for S1/ST, Saltelli 2002 for S2.
+    """
+    N = A.shape[0]
+    var = np.var(np.concatenate([A, B]), axis=0)[:, None]
+    S1 = np.mean(B[:, :, None] * (AB - A[:, :, None]), axis=0) / var
+    ST = 0.5 * np.mean((A[:, :, None] - AB) ** 2, axis=0) / var
+    S2 = None
+    if BA is not None:
+        Vjk = (np.einsum('nrj,nrk->rjk', BA, AB) / N - np.mean(A * B, axis=0)[:, None, None]) / var[:, :, None]
+        S2 = Vjk - S1[:, :, None] - S1[:, None, :]
+    return S1, ST, S2
+
+def _bootstrap_chunk(r):
+    A, B, AB, BA = _BOOTSTRAP_DATA
+    A_r, B_r = A[r], B[r]
+    estimates = _sobol_estimates(A_r, B_r, AB[r], None if BA is None else BA[r])
+    return estimates, float(np.ptp(np.concatenate([A_r, B_r])))
+
+def analyze_batched(problem, Y, calc_second_order=True, num_resamples=100, conf_level=0.95, print_to_console=False,
+                    seed=None, chunk_mb=BOOTSTRAP_CHUNK_MB, n_workers=BOOTSTRAP_WORKERS):
+    """
+    Drop-in replacement for SALib's sobol.analyze. Every parameter and a chunk of
+    bootstrap resamples are handled in one set of array operations, with chunks sized
+    to stay under chunk_mb and optionally spread over n_workers forked processes.
+    The resample indices are drawn exactly as SALib draws them, so for the same seed
+    (or global NumPy state when seed is None) the results match sobol.analyze.
+
+    Returns:
+        ResultDict: S1, S1_conf, ST, ST_conf and, with calc_second_order, S2 and S2_conf.
+    """
+    global _BOOTSTRAP_DATA
+    rng = np.random.default_rng(seed).integers if seed else np.random.randint
+    D = _num_factors(problem)
+    step = 2 * D + 2 if calc_second_order else D + 2
+    if Y.size % step != 0:
+        raise RuntimeError('Incorrect number of samples in model output, check calc_second_order matches the sample')
+    if not 0 < conf_level < 1:
+        raise RuntimeError('Confidence level must be between 0-1.')
+    N = Y.size // step
+
+    Y = (Y - Y.mean()) / Y.std()
+    A, B, AB, BA = _separate_output_values(Y, D, calc_second_order)
+    r = rng(N, size=(N, num_resamples))
+    Z = norm.ppf(0.5 + conf_level / 2)
+
+    # Point estimates are the same estimators applied to the identity resample
+    S1, ST, S2 = _sobol_estimates(A[:, None], B[:, None], AB[:, None, :], None if BA is None else BA[:, None, :])
+
+    # AB and BA dominate: (D or 2D) float64 values per row and resample
+    bytes_per_resample = N * (2 * D + 2 if calc_second_order else D + 2) * 8
+    chunk = max(1, min(num_resamples, int(chunk_mb * 1e6 // bytes_per_resample)))
+    chunks = [r[:, i:i + chunk] for i in range(0, num_resamples, chunk)]
+
+    _BOOTSTRAP_DATA = (A, B, np.ascontiguousarray(AB), None if BA is None else np.ascontiguousarray(BA))
     try:
-        predictions = predictor.predict(df).values
-        if np.any(np.isnan(predictions)) or np.any(np.isinf(predictions)):
-            print(f"Warning: NaN or Inf in predictions for inputs: {df.iloc[np.isnan(predictions) | np.isinf(predictions)]}")
-        return predictions
-    except Exception as e:
-        print(f"Error in model prediction: {e}")
-        return np.full(len(X), np.nan)
-
-def run_sobol_analysis(N, predictor, region_id, problem):
-    param_values = saltelli.sample(problem, N)
-    Y = model_function(param_values, predictor, region_id, problem)
+        if n_workers > 1 and len(chunks) > 1:
+            with ProcessPoolExecutor(min(n_workers, len(chunks)), mp_context=mp.get_context('fork')) as pool:
+                parts = list(pool.map(_bootstrap_chunk, chunks))
+        else:
+            parts = [_bootstrap_chunk(c) for c in chunks]
+    finally:
+        _BOOTSTRAP_DATA = None
+
+    var_diff = max(ptp for _, ptp in parts)
+    S1_r = np.concatenate([p[0][0] for p in parts])
+    ST_r = np.concatenate([p[0][1] for p in parts])
+
+    S = ResultDict()
+    S['S1'] = S1[0]
+    S['S1_conf'] = Z * S1_r.std(axis=0, ddof=1) if var_diff != 0.0 else np.zeros(D)
+    S['ST'] = ST[0]
+    S['ST_conf'] = Z * ST_r.std(axis=0, ddof=1) if var_diff != 0.0 else np.zeros(D)
+    if calc_second_order:
+        # SALib only fills the upper triangle
+        upper = np.triu(np.ones((D, D), dtype=bool), k=1)
+        S2_r = np.concatenate([p[0][2] for p in parts])
+        S['S2'] = np.where(upper, S2[0], np.nan)
+        S['S2_conf'] = np.where(upper, Z * S2_r.std(axis=0, ddof=1), np.nan)
+
+    S.problem = problem
+    S.to_df = MethodType(sobol.to_df, S)
+    if print_to_console:
+        for df in S.to_df():
+            print(df)
+    return S
+
+def _num_factors(problem):
+    if 'groups' in problem:
+        return len(set(problem['groups']))
+    return problem['num_vars']
+
+def drop_failed_blocks(problem, Y, calc_second_order=True):
+    """
+    Drop every base-sample block (2D+2 rows, or D+2 without second order) that holds a
+    NaN or Inf output, so rows that could not be predicted do not turn every index into NaN.
+    The estimators then see a smaller N.
+    """
+    rows_per_base = (2 if calc_second_order else 1) * _num_factors(problem) + 2
+    blocks = np.asarray(Y).reshape(-1, rows_per_base)
+    finite = np.isfinite(blocks).all(axis=1)
+    if finite.all():
+        return np.asarray(Y)
+    if not finite.any():
+        raise ValueError('Every base sample has a non-finite model output, nothing to analyse')
+    print(f"Warning: dropped {int((~finite).sum())} of {len(blocks)} base samples with non-finite output, "
+          f"analysing N={int(finite.sum())}")
+    return blocks[finite].ravel()
+
+def analyze(problem, Y, calc_second_order=True, print_to_console=False, estimator=ESTIMATOR, **kwargs):
+    Y = drop_failed_blocks(problem, Y, calc_second_order)
+    if estimator == 'salib':
+        return sobol.analyze(problem, Y, calc_second_order=calc_second_order, print_to_console=print_to_console, **kwargs)
+    if estimator != 'batched':
+        raise ValueError(f'Unknown Sobol estimator {estimator}')
+    return analyze_batched(problem, Y, calc_second_order=calc_second_order, print_to_console=print_to_console, **kwargs)
+
+def run_sobol_analysis(N, predictor, region_id, problem, param_values=None, cache=None, calc_second_order=True,
+                       tracer=None):
+    """
+    With calc_second_order=False the sample has N*(D+2) rows instead of N*(2D+2)
+    and only S1/ST are estimated. Sampling, prediction and analysis are recorded as
+    spans of tracer if one is given.
+    """
+    tracer = tracer or Tracer('sobol', mode='off')
+    if param_values is None:
+        with tracer.span('sample'):
+            param_values = get_saltelli_sample(problem, N, calc_second_order=calc_second_order)
+    with tracer.span('predict'):
+        Y = model_function(param_values, predictor, region_id, problem, cache=cache)
+    if np.any(np.isnan(Y)) or np.any(np.isinf(Y)):
+        print(f"Warning: {np.sum(np.isnan(Y))} NaN and {np.sum(np.isinf(Y))} Inf values in model output")
+    with tracer.span('analyze'):
+        return analyze(problem, Y, calc_second_order=calc_second_order, print_to_console=True)
+
+def run_sobol_analysis_adaptive(N_max, predictor, region_id, problem, N0=1024, tol=0.01, max_predictions=None, cache=None,
+                                calc_second_order=True, tracer=None):
+    """
+    Sobol analysis that doubles the base sample size from N0 until every S1_conf and
+    ST_conf is below tol, N_max is reached or the next step would exceed max_predictions.
+
+    Each step only evaluates the new points of the Sobol sequence: the sample for N is
+    the sample for N/2 followed by the next N/2 base points, so earlier predictions are
+    reused. The sequence skips N_max points, so running to N_max gives exactly the
+    sample of the fixed-N analysis.
+
+    Returns:
+        tuple: (Sobol results at the final N, convergence trace DataFrame)
+    """
+    tracer = tracer or Tracer('sobol', mode='off')
+    skip_values = int(2 ** np.ceil(np.log2(max(N_max, 16))))
+    rows_per_base = (2 if calc_second_order else 1) * _num_factors(problem) + 2
+    Y_parts = []
+    trace = []
+    n_done = 0
+    # The first step is bounded by N_max and the prediction budget like every later one
+    target = min(N0, N_max)
+    if max_predictions is not None:
+        while target > 1 and target * rows_per_base > max_predictions:
+            target //= 2
+        if target * rows_per_base > max_predictions:
+            raise ValueError(f'Prediction budget {max_predictions} is below one base sample of {rows_per_base} rows')
+    if target != N0:
+        print(f"Region {region_id} starting at N={target} instead of N0={N0} to stay within N_max and the prediction budget")
+    while True:
+        step_start = time.time()
+        with tracer.span('sample'):
+            param_values = get_saltelli_sample(problem, target - n_done, calc_second_order=calc_second_order,
+                                               skip_values=skip_values + n_done)
+        with tracer.span('predict'):
+            Y_parts.append(model_function(param_values, predictor, region_id, problem, cache=cache))
+        n_done = target
+        Y = np.concatenate(Y_parts)
+        with tracer.span('analyze'):
+            results = analyze(problem, Y, calc_second_order=calc_second_order)
+
+        max_s1_conf = float(np.nanmax(results['S1_conf']))
+        max_st_conf = float(np.nanmax(results['ST_conf']))
+        converged = max(max_s1_conf, max_st_conf) < tol
+        trace.append({'N': n_done, 'n_predictions': len(Y), 'max_S1_conf': max_s1_conf,
+                      'max_ST_conf': max_st_conf, 'converged': converged,
+                      'step_seconds': time.time() - step_start})
+        print(f"Region {region_id} N={n_done}: max S1_conf {max_s1_conf:.4f}, max ST_conf {max_st_conf:.4f}")
+
+        if converged:
+            print(f"Region {region_id} converged at N={n_done}")
+            break
+        if 2 * n_done > N_max:
+            print(f"Region {region_id} reached N_max={N_max} without converging to tol {tol}")
+            break
+        if max_predictions is not None and 2 * n_done * rows_per_base > max_predictions:
+            print(f"Region {region_id} stopped at N={n_done}: prediction budget {max_predictions} reached")
+            break
+        target = 2 * n_done
+
     if np.any(np.isnan(Y)) or np.any(np.isinf(Y)):
         print(f"Warning: {np.sum(np.isnan(Y))} NaN and {np.sum(np.isinf(Y))} Inf values in model output")
-    return sobol.analyze(problem, Y, print_to_console=True)
+    print(results.to_df())
+    return results, pd.DataFrame(trace)
 
 
 
 def save_results_to_csv_sobol(results, output_path, problem):
+    # S2 is only present when the second order design was sampled
     if 'groups' in problem:
         # For grouped analysis
         unique_groups = list(dict.fromkeys(problem['groups']))
@@ -44,35 +329,37 @@ def save_results_to_csv_sobol(results, output_path, problem):
         ST_df = pd.DataFrame({'parameter': unique_groups, 'ST': results['ST'], 'ST_conf': results['ST_conf']})
         
         # Create S2 data for grouped analysis
-        s2_data = []
-        for i, group1 in enumerate(unique_groups):
-            for j, group2 in enumerate(unique_groups):
-                s2_data.append({
-                    'group1': group1,
-                    'group2': group2,
-                    'S2': results['S2'][i][j],
-                    'S2_conf': results['S2_conf'][i][j]
-                })
-        S2_df = pd.DataFrame(s2_data)
-        S2_df.to_csv(os.path.join(output_path, 'sobol_S2_results.csv'), index=False)
+        if 'S2' in results:
+            s2_data = []
+            for i, group1 in enumerate(unique_groups):
+                for j, group2 in enumerate(unique_groups):
+                    s2_data.append({
+                        'group1': group1,
+                        'group2': group2,
+                        'S2': results['S2'][i][j],
+                        'S2_conf': results['S2_conf'][i][j]
+                    })
+            S2_df = pd.DataFrame(s2_data)
+            S2_df.to_csv(os.path.join(output_path, 'sobol_S2_results.csv'), index=False)
     else:
         # For non-grouped analysis
         S1_df = pd.DataFrame({'parameter': problem['names'], 'S1': results['S1'], 'S1_conf': results['S1_conf']})
         ST_df = pd.DataFrame({'parameter': problem['names'], 'ST': results['ST'], 'ST_conf': results['ST_conf']})
         
         # Create S2 data for non-grouped analysis
-        n_params = len(problem['names'])
-        s2_data = []
-        for i in range(n_params):
-            for j in range(n_params):
-                s2_data.append({
-                    'param1_name': problem['names'][i],
-                    'param2_name': problem['names'][j],
-                    'S2': results['S2'][i][j],
-                    'S2_conf': results['S2_conf'][i][j]
-                })
-        S2_df = pd.DataFrame(s2_data)
-        S2_df.to_csv(os.path.join(output_path, 'sobol_S2_results.csv'), index=False)
+        if 'S2' in results:
+            n_params = len(problem['names'])
+            s2_data = []
+            for i in range(n_params):
+                for j in range(n_params):
+                    s2_data.append({
+                        'param1_name': problem['names'][i],
+                        'param2_name': problem['names'][j],
+                        'S2': results['S2'][i][j],
+                        'S2_conf': results['S2_conf'][i][j]
+                    })
+            S2_df = pd.DataFrame(s2_data)
+            S2_df.to_csv(os.path.join(output_path, 'sobol_S2_results.csv'), index=False)
 
     S1_df.to_csv(os.path.join(output_path, 'sobol_S1_results.csv'), index=False)
     ST_df.to_csv(os.path.join(output_path, 'sobol_ST_results.csv'), index=False)
@@ -82,6 +369,9 @@ def save_results_to_csv_sobol(results, output_path, problem):
  
 
 def plot_sobol_heatmap(results, output_path, problem, group_mapping):
+    if 'S2' not in results:
+        print(f"No second order indices, skipping S2 heatmap in {output_path}")
+        return
     S2_matrix = results['S2']
     
     if 'groups' in problem:
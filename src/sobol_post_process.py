@@ -285,8 +285,11 @@ def plot_joint_sobol_comparison(s1_df, st_df, output_path, n):
     
     
 
-def analyse_sobol_single(BASE_PATH, TARGET_VAR, N, MODEL_FOLDER, COLSET):
+def analyse_sobol_single(BASE_PATH, TARGET_VAR, N, MODEL_FOLDER, COLSET, BASE_FOLDER='model_results'):
+    # Surrogate and PROBLEM_DIR runs get their own subfolder, so they keep the full model's roll-up intact
     op = os.path.join(BASE_PATH, f'{TARGET_VAR}_regional_analysis')
+    if MODEL_FOLDER != BASE_FOLDER:
+        op = os.path.join(op, MODEL_FOLDER)
     os.makedirs(op, exist_ok=True)
     s1_df, st_df, s2_df = analyze_regional_sobol(BASE_PATH, TARGET_VAR, N, model_folder=MODEL_FOLDER, colset=COLSET)
     s1_df['parameter'] = [PARAM_MAPPING[x] for x in s1_df['parameter']]
@@ -0,0 +1,86 @@
+import os
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import train_test_split
+
+from src.data_loader import CACHE_DIR
+
+REGIONS = ['SW', 'EM', 'EE', 'WA', 'SE', 'NW', 'YH', 'WM', 'LN', 'NE']
+TEST_SIZE = 0.2
+RANDOM_STATE = 42
+
+
+def get_split_dir(fingerprint, cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, 'splits', fingerprint)
+
+
+def _save_indices(path, idx):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, np.asarray(idx, dtype=np.int32))
+    os.replace(tmp_path, path)
+
+
+def _load_or_build(path, build_fn):
+    # Memory-mapped so runs share the page cache instead of holding their own copy
+    if not os.path.exists(path):
+        _save_indices(path, build_fn())
+    return np.load(path, mmap_mode='r')
+
+
+def global_split(n_rows, fingerprint, cache_dir=CACHE_DIR):
+    """
+    Row positions of the global 80/20 train/test split.
+    Matches train_test_split(df, test_size=0.2, random_state=42) on the full frame.
+    """
+    split_dir = get_split_dir(fingerprint, cache_dir)
+    train_path = os.path.join(split_dir, 'global_train.npy')
+    test_path = os.path.join(split_dir, 'global_test.npy')
+    if not (os.path.exists(train_path) and os.path.exists(test_path)):
+        train_idx, test_idx = train_test_split(np.arange(n_rows), test_size=TEST_SIZE, random_state=RANDOM_STATE)
+        _save_indices(train_path, train_idx)
+        _save_indices(test_path, test_idx)
+    return np.load(train_path, mmap_mode='r'), np.load(test_path, mmap_mode='r')
+
+
+def region_split(regions, region_id, fingerprint, cache_dir=CACHE_DIR):
+    """
+    Row positions for leave-one-region-out: train on every other region, test on region_id.
+    """
+    return _region_split(get_split_dir(fingerprint, cache_dir), region_id, lambda: np.asarray(regions == region_id))
+
+
+def _region_split(split_dir, region_id, in_region):
+    test_idx = _load_or_build(os.path.join(split_dir, f'region_{region_id}_test.npy'),
+                              lambda: np.flatnonzero(in_region()))
+    train_idx = _load_or_build(os.path.join(split_dir, f'region_{region_id}_train.npy'),
+                               lambda: np.flatnonzero(~in_region()))
+    return train_idx, test_idx
+
+
+def subset_split(train_idx, train_subset_prop, name, fingerprint, cache_dir=CACHE_DIR):
+    """
+    Row positions of a reduced training set, drawn as
+    train_test_split(train_data, test_size=1-prop, random_state=42) would.
+    name identifies the train rows it was drawn from (split and label).
+    """
+    path = os.path.join(get_split_dir(fingerprint, cache_dir), f'subset_{name}_{train_subset_prop}.npy')
+    return _load_or_build(path, lambda: train_test_split(
+        np.asarray(train_idx), test_size=1 - train_subset_prop, random_state=RANDOM_STATE)[0])
+
+
+def prepare_splits(df, fingerprint, cache_dir=CACHE_DIR):
+    """
+    Build the global and leave-one-region-out index files for a dataset up front,
+    so parallel runs only ever read them.
+    """
+    global_split(len(df), fingerprint, cache_dir)
+    if 'region' in df.columns:
+        # The region column is factorised once, so each fold is an integer comparison
+        codes, uniques = pd.factorize(df['region'])
+        region_codes = {region_id: code for code, region_id in enumerate(uniques)}
+        split_dir = get_split_dir(fingerprint, cache_dir)
+        for region_id in REGIONS:
+            code = region_codes.get(region_id, len(uniques))
+            _region_split(split_dir, region_id, lambda code=code: codes == code)
@@ -0,0 +1,100 @@
+import os
+import numpy as np
+import pandas as pd
+
+from src.column_settings import settings_dict, settings_col_dict_census, fc_final
+from src.feature_gen import type_setting1, age_setting1, eth_setting, econ_settings, hh_size_setting
+from src.splits import REGIONS
+
+LABELS = ['total_elec', 'total_gas']
+RUC_CODES = {'A1': 'Urban major conurbation', 'B1': 'Urban minor conurbation', 'C1': 'Urban city and town',
+             'C2': 'Urban city and town in a sparse setting', 'D1': 'Rural town and fringe',
+             'D2': 'Rural town and fringe in a sparse setting', 'E1': 'Rural village and dispersed',
+             'E2': 'Rural village and dispersed in a sparse setting'}
+FLOOR_AREA_CONFIDENCE = ['High', 'Medium', 'Low', 'Very Low', 'Not Applicable']
+AREA_CODES = ['oa21cd', 'lsoa21cd', 'msoa21cd', 'ladcd']
+
+
+def dataset_columns():
+    """
+    Every column the pipeline reads: all column settings, the raw inputs of
+    feature_gen.optimize_preprocessing, the postcode and both labels.
+    """
+    columns = ['postcode']
+    for setting_dict in [settings_dict, settings_col_dict_census]:
+        for _, setting_columns in setting_dict.values():
+            columns += setting_columns
+    for setting, suffix in [(type_setting1, '_pct'), (age_setting1, '_pct'), (eth_setting, ''),
+                            (econ_settings, ''), (hh_size_setting, '')]:
+        list_cols, _ = setting()
+        columns += [col + suffix for group in list_cols for col in group]
+    return list(dict.fromkeys(columns + LABELS))
+
+
+def _numeric_column(name, n_rows, rng):
+    if name.endswith('_pct') or name == 'percent_residential':
+        return rng.uniform(0, 100, n_rows)
+    if '_perc_' in name:
+        return rng.uniform(0, 1, n_rows)
+    if name.startswith(('HDD', 'CDD')):
+        base = 45 if name.startswith('HDD') else 5
+        return rng.normal(base, base * 0.1, n_rows)
+    if name == 'log_pc_area':
+        return rng.normal(9, 1, n_rows)
+    return rng.lognormal(3, 1, n_rows)
+
+
+def make_synthetic_dataset(n_rows, seed=42, missing_frac=0.01):
+    """
+    Synthetic postcode table with the schema of the NEBULA data: the same columns,
+    region and area codes, rural/urban classes and both labels. Labels depend on
+    the fc_final features plus noise, so models have something to learn.
+    """
+    rng = np.random.default_rng(seed)
+    data = {}
+    regions = rng.choice(REGIONS, n_rows)
+    area_ids = rng.integers(0, max(n_rows // 50, 1), n_rows)
+    ruc = rng.choice(list(RUC_CODES), n_rows)
+    for name in dataset_columns():
+        if name == 'postcode':
+            data[name] = [f'PC{i:07d}' for i in range(n_rows)]
+        elif name == 'region':
+            data[name] = regions
+        elif name in AREA_CODES:
+            level = AREA_CODES.index(name)
+            data[name] = pd.Series(area_ids // (10 ** level)).map(lambda i, p=name[:3].upper(): f'{p}{i:07d}').to_numpy()
+        elif name == 'RUC11CD':
+            data[name] = ruc
+        elif name == 'RUC11':
+            data[name] = pd.Series(ruc).map(RUC_CODES).to_numpy()
+        elif name == 'confidence_floor_area':
+            data[name] = rng.choice(FLOOR_AREA_CONFIDENCE, n_rows)
+        elif name in LABELS:
+            continue
+        else:
+            values = _numeric_column(name, n_rows, rng)
+            values[rng.random(n_rows) < missing_frac] = np.nan
+            data[name] = values
+
+    signal = np.zeros(n_rows)
+    for name in fc_final:
+        x = np.nan_to_num(data[name], nan=np.nanmean(data[name]))
+        signal += rng.normal() * (x - x.mean()) / x.std()
+    region_effect = pd.Series(regions).map({r: rng.normal(0, 0.5) for r in REGIONS}).to_numpy()
+    for label, scale in zip(LABELS, [3000, 12000]):
+        y = scale * np.exp(0.2 * (signal + region_effect) + rng.normal(0, 0.1, n_rows))
+        y[rng.random(n_rows) < missing_frac] = np.nan
+        data[label] = y
+    return pd.DataFrame(data)
+
+
+def write_synthetic_dataset(path, n_rows, seed=42):
+    """
+    Write make_synthetic_dataset to a CSV, like the NEBULA input file. Reuses an existing file.
+    """
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        make_synthetic_dataset(n_rows, seed).to_csv(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    return path
@@ -0,0 +1,68 @@
+import os
+import re
+from functools import lru_cache
+from autogluon.tabular import TabularPredictor
+
+# AutoGluon model classes and the hyperparameter keys that select them in fit()
+MODEL_KEYS = {
+    'LGBModel': 'GBM',
+    'CatBoostModel': 'CAT',
+    'XGBoostModel': 'XGB',
+    'RFModel': 'RF',
+    'XTModel': 'XT',
+    'KNNModel': 'KNN',
+    'LinearModel': 'LR',
+    'NNFastAiTabularModel': 'FASTAI',
+    'TabularNeuralNetTorchModel': 'NN_TORCH',
+}
+
+
+def _base_name(model_name):
+    # 'LightGBMXT_BAG_L1' -> 'LightGBMXT', AutoGluon adds the bagging and level suffixes again
+    return re.sub(r'(_BAG)?_L\d+$', '', model_name)
+
+
+@lru_cache(maxsize=None)
+def warm_start_hyperparameters(model_path):
+    """
+    fit() hyperparameters reproducing the first-level models of a trained predictor.
+
+    Each model keeps its hyperparameters and the values found while fitting it, such as
+    the number of boosting rounds or epochs at which early stopping ended, so a fit on
+    similar rows trains the same model zoo without searching again. Model families
+    without a key in MODEL_KEYS, and the weighted ensembles, are left out.
+
+    Parameters:
+        model_path (str): Directory of the trained predictor.
+
+    Returns:
+        dict: Hyperparameters keyed as TabularPredictor.fit expects, or None if no model could be reused.
+    """
+    predictor = TabularPredictor.load(model_path, require_version_match=True)
+    leaderboard = predictor.leaderboard(extra_info=True, silent=True)
+    leaderboard = leaderboard[(leaderboard['stack_level'] == 1) & ~leaderboard['model'].str.endswith('_FULL')]
+
+    def cell(row, field):
+        # Missing leaderboard cells are NaN, e.g. the child fields of models that were not bagged
+        value = row.get(field)
+        return value if isinstance(value, dict) else None
+
+    hyperparameters = {}
+    for _, row in leaderboard.iterrows():
+        # Bagged models report their fold models as children
+        child_type = row.get('child_model_type')
+        model_type = child_type if isinstance(child_type, str) else row['model_type']
+        key = MODEL_KEYS.get(model_type)
+        if key is None:
+            continue
+        params = dict(cell(row, 'child_hyperparameters') or cell(row, 'hyperparameters') or {})
+        params.update(cell(row, 'child_hyperparameters_fit') or cell(row, 'hyperparameters_fit') or {})
+        params['ag_args'] = {'name': _base_name(row['model'])}
+        hyperparameters.setdefault(key, []).append(params)
+
+    if not hyperparameters:
+        print(f'No reusable models in {model_path}, folds will search from scratch')
+        return None
+    print(f'Warm starting from {os.path.basename(os.path.normpath(model_path))}: '
+          f'{sum(len(configs) for configs in hyperparameters.values())} models')
+    return hyperparameters